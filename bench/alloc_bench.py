@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Heap allocated per blink cycle by the board's status path
+
+Runs the send path wifi_proof_of_concept.py takes on every blink, against
+a stand-in session that answers 200 at once, and measures the heap each
+cycle leaves for the garbage collector:
+    dict      a status dict with esp.pretty_ip() per cycle, queued as a copy
+              and JSON-encoded for the request, as the board did before
+    buffer    status_buffer.StatusBuffer filled with queue_status()
+
+Under MicroPython's unix port gc.mem_alloc() is read around each cycle
+with the collector disabled, so the figure is every byte allocated. Under
+CPython tracemalloc reports the peak above the starting heap, a lower
+bound of the same thing. Either way it also checks that every buffered
+record is one simple_server.py accepts.
+
+    python3 bench/alloc_bench.py
+    python3 bench/alloc_bench.py 2000 json
+    micropython bench/alloc_bench.py 2000 binary
+"""
+
+import gc
+import json
+import sys
+import time
+
+sys.path.insert(0, (__file__.rpartition('/')[0] or '.') + '/..')
+from status_buffer import StatusBuffer
+from telemetry_client import OFFLINE_BUFFER, TelemetryClient
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # MicroPython: gc.mem_alloc() instead
+
+BOARD = "Metro M4 Airlift Lite"
+IP_ADDRESS = bytes((192, 168, 1, 50))
+
+class FakeESP:
+    ip_address = IP_ADDRESS
+    is_connected = True
+
+    def pretty_ip(self, ip):
+        return "%d.%d.%d.%d" % (ip[0], ip[1], ip[2], ip[3])
+
+class Response:
+    status_code = 200
+    headers = {}
+
+    def close(self):
+        pass
+
+class Session:
+    """adafruit_requests stand-in that encodes a json= body the way it does"""
+    response = Response()
+
+    def __init__(self):
+        self.body = None
+
+    def post(self, url, json=None, data=None, headers=None):
+        self.body = encode_json(json).encode() if data is None else data
+        return self.response
+
+encode_json = json.dumps  # Session.post's json argument shadows the module
+
+def make_client(buffer=None, binary=False):
+    session = Session()
+    client = TelemetryClient(FakeESP(), "http://192.168.1.192:8000", lambda: None,
+                             make_session=lambda: session, binary=binary, buffer=buffer)
+    return client, session
+
+def dict_cycle(client, esp, count, status):
+    status_data = {
+        "status": status,
+        "count": count,
+        "board": BOARD,
+        "ip_address": esp.pretty_ip(esp.ip_address),
+        "timestamp": time.time()
+    }
+    client.queue(status_data)
+    client.poll()
+
+def buffer_cycle(client, esp, count, status):
+    client.queue_status(status, count, time.time())
+    client.poll()
+
+def measure(cycle, client, cycles):
+    """Bytes allocated per cycle: (mean, worst)"""
+    esp = FakeESP()
+    for count in range(10):
+        cycle(client, esp, count, "ON")  # Warm up: first send opens the session
+    gc.collect()
+    total = worst = 0
+    if tracemalloc is None:
+        gc.disable()
+        try:
+            for count in range(cycles):
+                before = gc.mem_alloc()
+                cycle(client, esp, count, "ON" if count % 2 else "OFF")
+                used = gc.mem_alloc() - before
+                total += used
+                worst = max(worst, used)
+        finally:
+            gc.enable()
+    else:
+        tracemalloc.start()
+        try:
+            for count in range(cycles):
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                cycle(client, esp, count, "ON" if count % 2 else "OFF")
+                used = tracemalloc.get_traced_memory()[1] - before
+                total += used
+                worst = max(worst, used)
+        finally:
+            tracemalloc.stop()
+    return total // cycles, worst
+
+def check_records(binary):
+    """Fill a buffer and make sure simple_server.py would accept every record"""
+    buffer = StatusBuffer(OFFLINE_BUFFER, BOARD, "192.168.1.50", binary=binary)
+    for count in range(OFFLINE_BUFFER):
+        buffer.append(("ON", "OFF", "Unknown")[count % 3], count * 104729, 1700000000 + count)
+    body = bytes(buffer.body(len(buffer)))
+    if binary:
+        from status_wire import decode_status_records
+        records = decode_status_records(body)
+    else:
+        records = [json.loads(line) for line in body.splitlines()]
+    try:
+        from simple_server import parse_status_update
+    except ImportError:
+        parse_status_update = None  # MicroPython: no asyncio server to borrow from
+    for count, record in enumerate(records):
+        expected = ("ON", "OFF", "Unknown")[count % 3], count * 104729, 1700000000 + count
+        if (record["status"], record["count"], record["timestamp"]) != expected:
+            raise AssertionError("record %d decoded as %r" % (count, record))
+        if parse_status_update is not None:
+            parse_status_update(record)
+    return len(records)
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    binary = len(sys.argv) > 2 and sys.argv[2] == "binary"
+    encoding = "binary" if binary else "json"
+    print("📦 %d records checked against the server's parser" % check_records(binary))
+    legacy, _ = make_client(binary=binary)
+    buffered, session = make_client(StatusBuffer(OFFLINE_BUFFER, BOARD, "192.168.1.50", binary=binary), binary)
+    method = "tracemalloc peak" if tracemalloc else "gc.mem_alloc()"
+    for name, cycle, client in (("dict", dict_cycle, legacy), ("buffer", buffer_cycle, buffered)):
+        mean, worst = measure(cycle, client, cycles)
+        print("🧮 %-6s %s: %d bytes per cycle (worst %d) over %d cycles, by %s" % (
+            name, encoding, mean, worst, cycles, method))
+    print("📤 Last buffered body: %r" % bytes(session.body))
+
+if __name__ == "__main__":
+    main()
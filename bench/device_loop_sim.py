@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Blink timing of wifi_proof_of_concept.py on Linux, with faults injected
+
+Runs the board program itself, unmodified, with stub board, busio,
+digitalio, neopixel, adafruit_esp32spi, adafruit_requests and config
+modules. The ESP32 is telemetry_bench.FakeESP: its calls block for as
+long as the real ones would, on a clock sped up --speed times, and faults
+are injected into it partway through each run:
+    none      nothing goes wrong
+    drop      one request times out
+    socket    the open socket wedges until a new one is opened
+    wifi      the access point drops the board
+    esp       the ESP32 stops answering until it is reset
+    outage    the server is unreachable for --outage seconds
+
+Each run records when the NeoPixel turned ON or OFF and reports how far
+blink periods strayed from BLINK_SECONDS (jitter), next to the blocking
+loop the board ran before device_tasks.py. The script exits non-zero if
+the board program's jitter exceeds --max-jitter in any scenario.
+
+    python3 bench/device_loop_sim.py
+    python3 bench/device_loop_sim.py --scenarios esp,wifi --duration 120 --output device_loop.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import runpy
+import sys
+import time
+import types
+
+from fleet_bench import REPO_DIR
+from telemetry_bench import FakeESP, Session
+
+sys.path.insert(0, REPO_DIR)
+import device_tasks
+import telemetry_client
+from status_buffer import StatusBuffer
+from telemetry_client import OFFLINE_BUFFER, TelemetryClient
+
+BOARD_SCRIPT = os.path.join(REPO_DIR, 'wifi_proof_of_concept.py')
+BLINK_SECONDS = 2  # Board seconds ON, then OFF, as in wifi_proof_of_concept.py
+FAULT_AT = 20  # Board seconds into a run when the fault is injected
+GREEN = (0, 255, 0)
+OFF = (0, 0, 0)
+
+class StopRun(BaseException):
+    """Ends a run from inside the board program; not an Exception, so it isn't caught there"""
+
+class ScaledClock:
+    """Real time sped up: one board second passes in 1/speed seconds"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.started = time.monotonic()
+
+    @property
+    def now(self):
+        return (time.monotonic() - self.started) * self.speed
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+class FakePixel:
+    """NeoPixel stand-in that records when the LED turned ON or OFF
+
+    It also injects the fault on schedule and ends the run.
+    """
+
+    def __init__(self, clock, esp, fault, outage, duration):
+        self.clock = clock
+        self.esp = esp
+        self.fault = fault
+        self.outage = outage
+        self.duration = duration
+        self.brightness = 1.0
+        self.toggles = []
+        self.lit = None  # Last ON/OFF color; the "WiFi connected!" green before the loop isn't a toggle
+        self.injected = fault == 'none'
+
+    def __setitem__(self, index, color):
+        now = self.clock.now
+        if now >= self.duration:
+            raise StopRun()
+        if not self.injected and now >= FAULT_AT:
+            self.esp.inject(self.fault, self.outage)
+            self.injected = True
+        if color in (GREEN, OFF) and color != self.lit:
+            if self.lit is not None:
+                self.toggles.append(now)
+            self.lit = color
+
+def stub_modules(esp, pixel, speed):
+    """The CircuitPython modules wifi_proof_of_concept.py imports"""
+    modules = {name: types.ModuleType(name) for name in (
+        'board', 'busio', 'digitalio', 'neopixel', 'adafruit_esp32spi', 'adafruit_esp32spi.adafruit_esp32spi',
+        'adafruit_esp32spi.adafruit_esp32spi_socketpool', 'adafruit_requests', 'config')}
+    for pin in ('NEOPIXEL', 'ESP_CS', 'ESP_BUSY', 'ESP_RESET', 'SCK', 'MOSI', 'MISO'):
+        setattr(modules['board'], pin, pin)
+    modules['busio'].SPI = lambda *pins: None
+    modules['digitalio'].DigitalInOut = lambda pin: None
+    modules['neopixel'].NeoPixel = lambda pin, count: pixel
+    modules['adafruit_esp32spi.adafruit_esp32spi'].ESP_SPIcontrol = lambda *pins: esp
+    modules['adafruit_esp32spi'].adafruit_esp32spi = modules['adafruit_esp32spi.adafruit_esp32spi']
+    modules['adafruit_esp32spi.adafruit_esp32spi_socketpool'].SocketPool = lambda esp: None
+    modules['adafruit_esp32spi'].adafruit_esp32spi_socketpool = modules['adafruit_esp32spi.adafruit_esp32spi_socketpool']
+    modules['adafruit_requests'].Session = lambda pool: Session(esp)
+    config = modules['config']
+    config.WIFI_SSID = "ssid"
+    config.WIFI_PASSWORD = "password"
+    config.SERVER_IP = "192.168.1.192"
+    config.SERVER_PORT = "8000"
+    config.STATUS_BATCH_SIZE = 1
+    config.STATUS_BATCH_MAX_AGE = 40 / speed
+    config.BLINK_SECONDS = BLINK_SECONDS / speed
+    return modules
+
+@contextlib.contextmanager
+def sped_up(speed):
+    """Scale the board code's own timing constants, which are in real seconds"""
+    constants = [(device_tasks, 'JOIN_TIMEOUT'), (device_tasks, 'JOIN_POLL'), (device_tasks, 'SUPERVISE_SECONDS'),
+                 (telemetry_client, 'BACKOFF_BASE'), (telemetry_client, 'BACKOFF_MAX')]
+    saved = [getattr(module, name) for module, name in constants]
+    for module, name in constants:
+        setattr(module, name, getattr(module, name) / speed)
+    try:
+        yield
+    finally:
+        for (module, name), value in zip(constants, saved):
+            setattr(module, name, value)
+
+def run_tasks(esp, clock, pixel, speed):
+    """wifi_proof_of_concept.py as it is now, on stub modules"""
+    modules = stub_modules(esp, pixel, speed)
+    saved = {name: sys.modules.get(name) for name in modules}
+    sys.modules.update(modules)
+    try:
+        runpy.run_path(BOARD_SCRIPT, run_name='__main__')
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+def run_legacy(esp, clock, pixel, speed):
+    """The loop wifi_proof_of_concept.py ran before device_tasks.py: send, then sleep"""
+    buffer = StatusBuffer(OFFLINE_BUFFER, "Metro M4 Airlift Lite", "192.168.1.50")
+    client = TelemetryClient(esp, "http://192.168.1.192:8000", lambda: esp.connect_AP("ssid", "password"),
+                             make_session=lambda: Session(esp), buffer=buffer)
+    count = 0
+    while True:
+        for on, color in ((True, GREEN), (False, OFF)):
+            try:
+                pixel[0] = color
+                client.queue_status("ON" if on else "OFF", count, time.time())
+                client.poll()
+                time.sleep(BLINK_SECONDS / speed)
+            except Exception:
+                client.reset_esp()
+                time.sleep(BLINK_SECONDS / speed)
+        count += 1
+
+def jitter(toggles):
+    """How far blink periods and toggles strayed from the schedule, in board seconds"""
+    periods = [after - before for before, after in zip(toggles, toggles[1:])]
+    errors = sorted(abs(period - BLINK_SECONDS) for period in periods)
+    return {
+        "toggles": len(toggles),
+        "max_jitter_s": round(errors[-1], 3),
+        "p99_jitter_s": round(errors[min(len(errors) - 1, int(len(errors) * 0.99))], 3),
+        "longest_period_s": round(max(periods), 3),
+        "drift_s": round(toggles[-1] - toggles[0] - (len(toggles) - 1) * BLINK_SECONDS, 3),
+    }
+
+def run_scenario(loop, fault, duration, outage, speed):
+    clock = ScaledClock(speed)
+    esp = FakeESP(clock)
+    pixel = FakePixel(clock, esp, fault, outage, duration)
+    try:
+        loop(esp, clock, pixel, speed)
+    except StopRun:
+        pass
+    result = jitter(pixel.toggles)
+    result["esp_resets"] = esp.resets
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Blink timing of wifi_proof_of_concept.py on Linux")
+    parser.add_argument('--scenarios', default='none,drop,socket,wifi,esp,outage', help="Comma-separated faults to inject")
+    parser.add_argument('--duration', type=float, default=60, help="Board seconds per run")
+    parser.add_argument('--outage', type=float, default=20, help="Seconds the server is down in the outage scenario")
+    parser.add_argument('--speed', type=float, default=10, help="How many times faster than real time to run")
+    parser.add_argument('--max-jitter', type=float, default=0.25, help="Largest blink period error allowed (board seconds)")
+    parser.add_argument('--verbose', action='store_true', help="Show the board program's own output")
+    parser.add_argument('--output', help="Also write the report here as JSON")
+    args = parser.parse_args()
+
+    report = {}
+    failures = []
+    for fault in args.scenarios.split(','):
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with sped_up(args.speed), quiet:
+            report[fault] = {
+                "tasks": run_scenario(run_tasks, fault, args.duration, args.outage, args.speed),
+                "legacy": run_scenario(run_legacy, fault, args.duration, args.outage, args.speed),
+            }
+        print(f"💥 {fault}")
+        for name, result in report[fault].items():
+            print(f"   {name:6} max jitter {result['max_jitter_s']}s (p99 {result['p99_jitter_s']}s),"
+                  f" longest period {result['longest_period_s']}s, drift {result['drift_s']}s,"
+                  f" {result['toggles']} toggles, {result['esp_resets']} ESP32 resets")
+        if report[fault]["tasks"]["max_jitter_s"] > args.max_jitter:
+            failures.append(fault)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Wrote {args.output}")
+    if failures:
+        print(f"❌ Blink jitter over {args.max_jitter}s in: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"✅ Blink jitter within {args.max_jitter}s in every scenario")
+
+if __name__ == "__main__":
+    main()
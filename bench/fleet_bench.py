@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Fleet load generator and end-to-end benchmark for simple_server.py
+
+Starts the server locally, then simulates N boards posting /status on the
+same ON/OFF schedule as wifi_proof_of_concept.py while M WebSocket viewers
+watch. Reports ingest throughput, ingest-to-delivery latency, server CPU
+and memory for every (N, M) pair, writes the results as JSON and compares
+them with a saved baseline.
+
+    python3 bench/fleet_bench.py --boards 10,100 --viewers 1,20 --duration 20
+    python3 bench/fleet_bench.py --output bench_results.json --save-baseline bench/baseline.json
+    python3 bench/fleet_bench.py --baseline bench/baseline.json
+    python3 bench/fleet_bench.py --boards 500 --viewers 50 --workers 1,2,4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(REPO_DIR, 'simple_server.py')
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class ServerProcess:
+    """simple_server.py running in a child process on free ports"""
+
+    def __init__(self, extra_args=()):
+        self.http_port = free_port()
+        self.ws_port = free_port()
+        self.udp_port = free_port()
+        self.work_dir = tempfile.mkdtemp(prefix='fleet_bench_')  # Status log and uploads; removed by stop()
+        self.extra_args = list(extra_args)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, '--host', '127.0.0.1',
+             '--http-port', str(self.http_port), '--ws-port', str(self.ws_port),
+             '--udp-port', str(self.udp_port), '--status-log-dir', os.path.join(self.work_dir, 'status_log'),
+             '--data-dir', os.path.join(self.work_dir, 'data_uploads')] + self.extra_args,
+            cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.http_port), timeout=0.2).close()
+                socket.create_connection(('127.0.0.1', self.ws_port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("server did not start")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def pids(self):
+        """The server process plus its --workers children"""
+        try:
+            with open(f'/proc/{self.process.pid}/task/{self.process.pid}/children') as f:
+                return [self.process.pid] + [int(pid) for pid in f.read().split()]
+        except OSError:
+            try:
+                import psutil
+                return [self.process.pid] + [child.pid for child in psutil.Process(self.process.pid).children()]
+            except ImportError:
+                return [self.process.pid]
+
+    def cpu_seconds(self):
+        """User + system CPU time used by the server so far"""
+        total = 0.0
+        for pid in self.pids():
+            try:
+                import psutil
+                times = psutil.Process(pid).cpu_times()
+                total += times.user + times.system
+            except ImportError:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return total
+
+    def rss_bytes(self):
+        """Resident memory of the server"""
+        total = 0
+        for pid in self.pids():
+            try:
+                import psutil
+                total += psutil.Process(pid).memory_info().rss
+            except ImportError:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+        return total
+
+async def http_post(reader, writer, path, body, content_type='application/json'):
+    """Send one keep-alive POST and wait for the full response"""
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    if length:
+        await reader.readexactly(length)
+    return status
+
+async def virtual_board(index, port, interval, stop_at, stats):
+    """Post ON, wait, post OFF, wait - like wifi_proof_of_concept.py"""
+    device_id = f"bench-{index:05d}"
+    ip_address = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+    await asyncio.sleep(random.uniform(0, 2 * interval))  # Boards don't boot in lockstep
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    count = 0
+    try:
+        while time.time() < stop_at:
+            for state in ("ON", "OFF"):
+                body = json.dumps({"device_id": device_id, "status": state, "count": count,
+                                   "board": "Metro M4 Airlift Lite", "ip_address": ip_address,
+                                   "timestamp": time.time()}).encode()
+                started = time.perf_counter()
+                status = await http_post(reader, writer, '/status', body)
+                stats['post_latency'].append(time.perf_counter() - started)
+                stats['posts' if status == 200 else 'errors'] += 1
+                await asyncio.sleep(interval)
+            count += 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+        stats['errors'] += 1
+    finally:
+        writer.close()
+
+async def viewer(port, stop_at, stats):
+    """Dashboard stand-in that measures ingest-to-delivery latency"""
+    async with websockets.connect(f'ws://127.0.0.1:{port}', max_queue=None) as ws:
+        stats['viewers_connected'] += 1
+        while True:
+            remaining = stop_at - time.time()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+                return
+            received = time.time()
+            data = json.loads(message)
+            if str(data.get('device_id', '')).startswith('bench-'):
+                stats['delivery_latency'].append(received - data['timestamp'])
+
+async def run_point(server, boards, viewers, duration, interval, warmup, workers=1):
+    """Drive one (boards, viewers) combination and collect samples"""
+    stats = {'posts': 0, 'errors': 0, 'viewers_connected': 0,
+             'post_latency': [], 'delivery_latency': []}
+    stop_at = time.time() + warmup + duration
+    viewer_tasks = [asyncio.create_task(viewer(server.ws_port, stop_at, stats)) for _ in range(viewers)]
+    await asyncio.sleep(0.5)
+    board_tasks = [asyncio.create_task(virtual_board(i, server.http_port, interval, stop_at, stats))
+                   for i in range(boards)]
+
+    # Discard the warmup period so connection setup doesn't skew the numbers
+    await asyncio.sleep(warmup)
+    stats['posts'] = 0
+    stats['post_latency'].clear()
+    stats['delivery_latency'].clear()
+    cpu_start = server.cpu_seconds()
+    started = time.time()
+
+    await asyncio.gather(*board_tasks, *viewer_tasks, return_exceptions=True)
+    elapsed = time.time() - started
+    cpu_used = server.cpu_seconds() - cpu_start
+
+    delivery = sorted(stats['delivery_latency'])
+    posts = sorted(stats['post_latency'])
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "boards": boards,
+        "viewers": viewers,
+        "workers": workers,
+        "duration_s": round(elapsed, 2),
+        "ingest_per_s": round(stats['posts'] / elapsed, 1),
+        "errors": stats['errors'],
+        "deliveries": len(delivery),
+        "post_p50_ms": ms(percentile(posts, 0.50)),
+        "post_p99_ms": ms(percentile(posts, 0.99)),
+        "delivery_p50_ms": ms(percentile(delivery, 0.50)),
+        "delivery_p99_ms": ms(percentile(delivery, 0.99)),
+        "delivery_max_ms": ms(delivery[-1] if delivery else None),
+        "server_cpu_percent": round(100 * cpu_used / elapsed, 1),
+        "server_rss_mb": round(server.rss_bytes() / 1e6, 1),
+    }
+
+def compare(results, baseline, tolerance):
+    """Print a comparison with the baseline; return the regressions found"""
+    previous = {(r['boards'], r['viewers'], r.get('workers', 1)): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result['boards'], result['viewers'], result['workers']))
+        if old is None:
+            continue
+        checks = [
+            ('ingest_per_s', result['ingest_per_s'] < old['ingest_per_s'] * (1 - tolerance)),
+            ('delivery_p99_ms', (result['delivery_p99_ms'] or 0) > (old['delivery_p99_ms'] or 0) * (1 + tolerance)),
+            ('server_cpu_percent', result['server_cpu_percent'] > old['server_cpu_percent'] * (1 + tolerance)),
+        ]
+        for metric, regressed in checks:
+            marker = '❌' if regressed else '✅'
+            print(f"{marker} N={result['boards']} M={result['viewers']} {metric}: {old[metric]} -> {result[metric]}")
+            if regressed:
+                regressions.append((result['boards'], result['viewers'], metric))
+    return regressions
+
+def parse_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet benchmark for simple_server.py")
+    parser.add_argument('--boards', type=parse_list, default=[10, 100], help="Comma-separated board counts (N)")
+    parser.add_argument('--viewers', type=parse_list, default=[1, 10], help="Comma-separated viewer counts (M)")
+    parser.add_argument('--workers', type=parse_list, default=[1],
+                        help="Comma-separated server worker process counts")
+    parser.add_argument('--duration', type=float, default=20, help="Measured seconds per point")
+    parser.add_argument('--warmup', type=float, default=5, help="Seconds discarded before measuring")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help="Seconds between ON and OFF posts (2.0 matches the board)")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write results")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="Also write the results here as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        for boards in args.boards:
+            for viewers in args.viewers:
+                server = ServerProcess(['--workers', str(workers)])
+                server.start()
+                try:
+                    print(f"🏁 N={boards} boards, M={viewers} viewers, {workers} worker(s) ...")
+                    result = asyncio.run(run_point(server, boards, viewers, args.duration,
+                                                   args.interval, args.warmup, workers))
+                finally:
+                    server.stop()
+                results.append(result)
+                print(f"   📥 {result['ingest_per_s']}/s ingest, ⏱️ delivery p50 {result['delivery_p50_ms']} ms"
+                      f" p99 {result['delivery_p99_ms']} ms max {result['delivery_max_ms']} ms,"
+                      f" 🖥️ {result['server_cpu_percent']}% CPU, {result['server_rss_mb']} MB")
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "interval_s": args.interval,
+        "results": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.baseline}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+if __name__ == "__main__":
+    main()
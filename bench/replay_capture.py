@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Replay recorded status traffic into simple_server.py
+
+Plays back captures made with simple_server.py --record at 1x, 10x, 100x
+or as fast as possible (--speed max). Every recorded sender gets its own
+keep-alive connection and its requests go out in recorded order, so
+bursts after WiFi drops and paired ON/OFF posts keep their shape. A
+WebSocket viewer watches the fan-out. The report shows how far sends and
+deliveries drifted from the recorded timeline, scaled by the speed.
+At high speeds a board's updates arrive faster than the server fans them
+out (BROADCAST_MIN_INTERVAL), so fewer deliveries than updates is expected.
+
+    python3 simple_server.py --record capture.m4cap.gz      # in production
+    python3 bench/replay_capture.py capture.m4cap.gz --speed 10
+    python3 bench/replay_capture.py capture.m4cap.gz --speed max --server 127.0.0.1:8000 --ws-port 8765
+
+Without --server a local server is started with rate limiting off, so an
+accelerated replay isn't answered with 429s.
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import sys
+import time
+
+import websockets
+
+from fleet_bench import REPO_DIR, ServerProcess, http_post, percentile
+
+sys.path.insert(0, REPO_DIR)
+from status_wire import STATUS_CONTENT_TYPE, decode_status_records
+from traffic_capture import read_capture
+
+def parse_speed(text):
+    """Replay speed multiplier; 'max' (0) sends as fast as the server answers"""
+    return 0.0 if text == 'max' else float(text)
+
+def load_requests(paths):
+    """Every recorded request from one or more captures, in arrival order"""
+    return list(heapq.merge(*[read_capture(path) for path in paths]))
+
+def status_keys(path, binary, body):
+    """(device_id, status, count) for each status update a request carries"""
+    if path == '/data':
+        return []
+    try:
+        if binary:
+            records = decode_status_records(body)
+        else:
+            records = json.loads(body)
+            if isinstance(records, dict):
+                records = [records]
+            elif path == '/status/batch' and not isinstance(records, list):
+                return []
+    except ValueError:
+        try:
+            records = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        except ValueError:
+            return []
+    keys = []
+    for record in records:
+        if isinstance(record, dict):
+            # Same identity rule as simple_server.parse_status_update
+            device_id = str(record.get('device_id') or record.get('ip_address') or record.get('board') or 'unknown')
+            keys.append((device_id, record.get('status'), record.get('count')))
+    return keys
+
+async def replay_sender(host, port, requests, start, first_arrival, speed, stats):
+    """Send one recorded sender's requests in order on its own connection"""
+    reader = writer = None
+    try:
+        for arrival, path, binary, _, body in requests:
+            target = start + (arrival - first_arrival) / speed if speed else time.time()
+            delay = target - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            sent = time.time()
+            stats['send_lag'].append(sent - target)
+            for key in status_keys(path, binary, body):
+                stats['sent'][key] = (sent, target)
+            try:
+                status = await http_post(reader, writer, path, body,
+                                         STATUS_CONTENT_TYPE if binary else 'application/json')
+            except (ConnectionError, asyncio.IncompleteReadError):
+                status = 'error'
+                writer.close()
+                reader = writer = None
+            stats['responses'][status] = stats['responses'].get(status, 0) + 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def watch(host, ws_port, stop, stats):
+    """Record when each update reaches a viewer"""
+    async with websockets.connect(f'ws://{host}:{ws_port}', max_queue=None) as ws:
+        stats['viewer_ready'].set()
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            except websockets.exceptions.ConnectionClosed:
+                return
+            received = time.time()
+            data = json.loads(message)
+            sent = stats['sent'].get((data.get('device_id'), data.get('status'), data.get('count')))
+            if sent is not None:
+                stats['delivery_latency'].append(received - sent[0])
+                stats['delivery_drift'].append(received - sent[1])
+
+async def replay(requests, host, http_port, ws_port, speed, settle):
+    """Drive the whole capture and collect timing samples"""
+    stats = {'send_lag': [], 'delivery_latency': [], 'delivery_drift': [], 'responses': {},
+             'sent': {}, 'viewer_ready': asyncio.Event()}
+    stop = asyncio.Event()
+    viewer = asyncio.create_task(watch(host, ws_port, stop, stats))
+    await asyncio.wait_for(stats['viewer_ready'].wait(), 10)
+
+    by_sender = {}
+    for request in requests:
+        by_sender.setdefault(request[3], []).append(request)
+    start = time.time() + (0.5 if speed else 0)  # Give senders a head start on a timed replay
+    first_arrival = requests[0][0]
+    await asyncio.gather(*[replay_sender(host, http_port, sender_requests, start, first_arrival, speed, stats)
+                           for sender_requests in by_sender.values()])
+    elapsed = time.time() - start
+    await asyncio.sleep(settle)  # Deliveries still in flight
+    stop.set()
+    await viewer
+    stats['senders'] = len(by_sender)
+    stats['elapsed'] = elapsed
+    return stats
+
+def summarize(requests, speed, stats):
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    lag = sorted(stats['send_lag'])
+    latency = sorted(stats['delivery_latency'])
+    drift = sorted(stats['delivery_drift'])
+    recorded = requests[-1][0] - requests[0][0]
+    return {
+        "requests": len(requests),
+        "senders": stats['senders'],
+        "speed": speed or 'max',
+        "recorded_s": round(recorded, 3),
+        "replayed_s": round(stats['elapsed'], 3),
+        "achieved_speed": round(recorded / stats['elapsed'], 2) if stats['elapsed'] > 0 else None,
+        "responses": {str(code): count for code, count in sorted(stats['responses'].items(), key=str)},
+        "deliveries": len(latency),
+        "send_lag_p50_ms": ms(percentile(lag, 0.50)),
+        "send_lag_p99_ms": ms(percentile(lag, 0.99)),
+        "send_lag_max_ms": ms(lag[-1] if lag else None),
+        "delivery_p50_ms": ms(percentile(latency, 0.50)),
+        "delivery_p99_ms": ms(percentile(latency, 0.99)),
+        "drift_p50_ms": ms(percentile(drift, 0.50)),
+        "drift_p99_ms": ms(percentile(drift, 0.99)),
+        "drift_max_ms": ms(drift[-1] if drift else None),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured status traffic into simple_server.py")
+    parser.add_argument('captures', nargs='+', help="Capture files (several workers' files are merged)")
+    parser.add_argument('--speed', type=parse_speed, default=1.0, help="1, 10, 100, ... or max")
+    parser.add_argument('--server', help="HOST:PORT of a running server (default: start one locally)")
+    parser.add_argument('--ws-port', type=int, default=8765, help="WebSocket port of --server")
+    parser.add_argument('--settle', type=float, default=2.0, help="Seconds to wait for late deliveries")
+    parser.add_argument('--output', help="Also write the report here as JSON")
+    args = parser.parse_args()
+
+    requests = load_requests(args.captures)
+    if not requests:
+        sys.exit("❌ No requests in the capture")
+    print(f"📼 {len(requests)} requests over {requests[-1][0] - requests[0][0]:.1f}s recorded")
+
+    server = None
+    if args.server:
+        host, _, port = args.server.rpartition(':')
+        http_port, ws_port = int(port), args.ws_port
+    else:
+        server = ServerProcess(['--device-rate', '0', '--global-rate', '0', '--log-level', 'WARNING'])
+        server.start()
+        host, http_port, ws_port = '127.0.0.1', server.http_port, server.ws_port
+    try:
+        stats = asyncio.run(replay(requests, host, http_port, ws_port, args.speed, args.settle))
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = summarize(requests, args.speed, stats)
+    label = f"{args.speed:g}x" if args.speed else "max speed"
+    print(f"▶️ Replayed at {label}: {report['replayed_s']}s ({report['achieved_speed']}x achieved),"
+          f" responses {report['responses']}")
+    print(f"   📤 send lag p50 {report['send_lag_p50_ms']} ms p99 {report['send_lag_p99_ms']} ms"
+          f" max {report['send_lag_max_ms']} ms")
+    print(f"   📥 {report['deliveries']} deliveries, latency p50 {report['delivery_p50_ms']} ms"
+          f" p99 {report['delivery_p99_ms']} ms")
+    print(f"   ⏱️ drift from recorded timing p50 {report['drift_p50_ms']} ms p99 {report['drift_p99_ms']} ms"
+          f" max {report['drift_max_ms']} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
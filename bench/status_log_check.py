@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Check that status_log.py replays records oldest first, before and after compaction
+
+Writes interleaved updates from several boards into log segments, compacts
+them the way StatusLog does once too many segments have closed, and
+checks that replay_directory() still yields every kept record in arrival
+order, with the newest --keep records of each board, followed by the
+segments written after the compaction. It also checks the
+heapq.merge of two such directories that simple_server.restore_state
+does with --workers. Exits non-zero on the first mismatch.
+
+    python3 bench/status_log_check.py
+    python3 bench/status_log_check.py --boards 50 --records 20000 --keep 100
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+
+from fleet_bench import REPO_DIR
+
+sys.path.insert(0, REPO_DIR)
+from status_log import StatusLog, encode_record, replay_directory
+
+def write_segment(directory, number, records):
+    with open(os.path.join(directory, f"status-{number:06d}.log"), 'wb') as f:
+        f.writelines(encode_record(*record) for record in records)
+
+def make_records(boards, count, started, rng):
+    """Updates from boards reporting in random order, one per millisecond"""
+    return [(started + index / 1000, f"board-{rng.randrange(boards)}", "default", "ON" if index % 2 else "OFF",
+             index, "Metro M4 Airlift Lite", "192.168.1.50", float(index)) for index in range(count)]
+
+def expected_after_compaction(records, keep):
+    """The newest keep records of each board, in arrival order"""
+    per_board = {}
+    for record in records:
+        per_board.setdefault(record[1], []).append(record)
+    kept = [record for board in per_board.values() for record in board[-keep:]]
+    return sorted(kept)
+
+def check(name, replayed, expected):
+    if replayed != expected:
+        first = next((i for i, (a, b) in enumerate(zip(replayed, expected)) if a != b), min(len(replayed), len(expected)))
+        print(f"❌ {name}: {len(replayed)} records replayed, {len(expected)} expected, first difference at {first}")
+        sys.exit(1)
+    ordered = all(a[0] <= b[0] for a, b in zip(replayed, replayed[1:]))
+    if not ordered:
+        print(f"❌ {name}: records are not oldest first")
+        sys.exit(1)
+    print(f"✅ {name}: {len(replayed)} records, oldest first")
+
+def build_directory(directory, args, started, rng):
+    """Segments 1-4 compacted into status-000004.compact, then segment 5; returns what replay should yield"""
+    segments = [make_records(args.boards, args.records // 5, started + n * args.records, rng) for n in range(5)]
+    for number, records in enumerate(segments[:4], 1):
+        write_segment(directory, number, records)
+    check(f"{os.path.basename(directory)} before compaction", list(replay_directory(directory)),
+          [record for records in segments[:4] for record in records])
+    StatusLog(directory, keep_per_device=args.keep).compact(4)
+    write_segment(directory, 5, segments[4])
+    return expected_after_compaction([record for records in segments[:4] for record in records], args.keep) + segments[4]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check status_log.py replay order across compaction")
+    parser.add_argument('--boards', type=int, default=8, help="Boards writing to the log")
+    parser.add_argument('--records', type=int, default=5000, help="Records per directory")
+    parser.add_argument('--keep', type=int, default=50, help="Records per board kept by compaction")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the board order")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as root:
+        directories = [os.path.join(root, f"worker-{n}") for n in range(2)]
+        expected = []
+        for offset, directory in enumerate(directories):
+            os.makedirs(directory)
+            records = build_directory(directory, args, 1_700_000_000 + offset * 0.0005, rng)
+            check(f"worker-{offset} after compaction", list(replay_directory(directory)), records)
+            expected.append(records)
+        merged = list(heapq.merge(*[replay_directory(directory) for directory in directories]))
+        check("workers merged", merged, list(heapq.merge(*expected)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Recovery time and throughput of telemetry_client.py, on Linux
+
+The board's ESP32 and requests session are replaced by stand-ins.
+Faults are injected into the fake ESP32 on a simulated clock, so a run
+covers minutes of board time in milliseconds. Each scenario also runs
+the reset-on-every-failure loop wifi_proof_of_concept.py used before,
+for comparison:
+    drop     one request times out
+    socket   the open socket wedges until a new one is opened
+    wifi     the access point drops the board
+    esp      the ESP32 stops answering until it is reset
+    outage   the server is unreachable for --outage seconds
+    error    the server answers 503 for --outage seconds
+
+Recovery is the time from the fault to the next record delivered, and
+stall is the longest the device loop was held up inside one send, which
+is how long the LED stopped blinking on time. A throughput run then posts
+real requests to a local simple_server.py, with one kept-alive
+connection and with a new connection for every post.
+
+    python3 bench/telemetry_bench.py
+    python3 bench/telemetry_bench.py --scenarios drop,esp --records 5000 --output telemetry.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+from fleet_bench import REPO_DIR, ServerProcess
+
+sys.path.insert(0, REPO_DIR)
+from telemetry_client import OFFLINE_BUFFER, SEND_ERRORS, TelemetryClient
+
+REQUEST_SECONDS = 0.05  # A request that goes through
+FAILED_REQUEST_SECONDS = 1.0  # A request that fails, i.e. the socket timeout
+ESP_BOOT_SECONDS = 1.0  # esp.reset() until the ESP32 answers again
+WIFI_JOIN_SECONDS = 2.5  # esp.connect_AP()
+BLINK_SECONDS = 2  # The device loop sends one record per blink phase
+
+encode_json = json.dumps  # Session.post's json argument shadows the module
+
+class SimClock:
+    """Simulated monotonic clock; sleeping just moves it forward"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeESP:
+    """ESP_SPIcontrol stand-in that fails the way the real one does"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.connected = True
+        self.ip_address = bytes((192, 168, 1, 50))
+        self.generation = 0  # Bumped by reset(); sockets opened earlier are dead
+        self.wedged = 0  # Sessions numbered up to this have a wedged socket
+        self.drop_next = False
+        self.hung = False
+        self.server_down_until = 0
+        self.server_error_until = 0
+        self.accepted = 0  # Records the stand-in server took
+        self.joined_at = None  # When a join started by wifi_set_passphrase() completes
+        self.resets = 0
+
+    @property
+    def is_connected(self):
+        return self.status == 3
+
+    @property
+    def status(self):
+        """WL_CONNECTED (3) once joined, like esp32spi"""
+        if self.hung:
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise RuntimeError("Timed out waiting for SPI char")
+        if self.joined_at is not None and self.clock.now >= self.joined_at:
+            self.connected = True
+            self.joined_at = None
+        return 3 if self.connected else 0
+
+    def pretty_ip(self, ip):
+        return "%d.%d.%d.%d" % tuple(ip)
+
+    def inject(self, fault, outage):
+        if fault == 'drop':
+            self.drop_next = True
+        elif fault == 'socket':
+            self.wedged = Session.opened
+        elif fault == 'wifi':
+            self.connected = False
+        elif fault == 'esp':
+            self.hung = True
+        elif fault == 'outage':
+            self.server_down_until = self.clock.now + outage
+        elif fault == 'error':
+            self.server_error_until = self.clock.now + outage
+
+    def check(self, session):
+        """Raise like esp32spi does when a request on this session can't get through"""
+        if self.hung:
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise RuntimeError("Timed out waiting for SPI char")
+        if not self.connected:
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise ConnectionError("Not connected to an access point")
+        if self.drop_next:
+            self.drop_next = False
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise OSError(110, "request timed out")
+        if session.number <= self.wedged or session.generation < self.generation:
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise OSError(23, "socket wedged")
+        if self.clock.now < self.server_down_until:
+            self.clock.sleep(FAILED_REQUEST_SECONDS)
+            raise OSError(113, "no route to host")
+
+    def reset(self):
+        self.resets += 1
+        self.clock.sleep(ESP_BOOT_SECONDS)
+        self.hung = False
+        self.connected = False
+        self.joined_at = None
+        self.generation += 1
+
+    def disconnect(self):
+        self.connected = False
+
+    def wifi_set_passphrase(self, ssid, password):
+        """Start joining; status turns WL_CONNECTED once it is done"""
+        if self.hung:
+            raise RuntimeError("No response from ESP32")
+        self.joined_at = self.clock.now + WIFI_JOIN_SECONDS
+
+    def connect_AP(self, ssid, password):
+        if self.hung:
+            raise RuntimeError("No response from ESP32")
+        self.clock.sleep(WIFI_JOIN_SECONDS)
+        self.connected = True
+
+class Response:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+    def close(self):
+        pass
+
+class Session:
+    """adafruit_requests.Session stand-in
+
+    With a server it really posts, over one kept-alive connection or a
+    new one per request (reuse=False); without one every post is a 200.
+    """
+    opened = 0
+
+    def __init__(self, esp, server=None, reuse=True):
+        Session.opened += 1
+        self.number = Session.opened
+        self.generation = esp.generation
+        self.esp = esp
+        self.server = server
+        self.reuse = reuse
+        self.connection = None
+
+    def post(self, url, json=None, data=None, headers=None):
+        self.esp.check(self)
+        if self.server is None:
+            self.esp.clock.sleep(REQUEST_SECONDS)
+            if self.esp.clock.now < self.esp.server_error_until:
+                return Response(503, {})
+            self.esp.accepted += len(json) if isinstance(json, list) else 1
+            return Response(200, {})
+        body = data if data is not None else encode_json(json).encode()
+        headers = {'Content-Type': 'application/json', **(headers or {})}
+        if not self.reuse:
+            headers['Connection'] = 'close'
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(*self.server)
+        self.connection.request('POST', urlsplit(url).path, body, headers)
+        response = self.connection.getresponse()
+        response.read()
+        if not self.reuse:
+            self.connection.close()
+            self.connection = None
+        return Response(response.status, {name.lower(): value for name, value in response.getheaders()})
+
+class LegacySender:
+    """Send loop wifi_proof_of_concept.py ran before telemetry_client.py
+
+    Any failure resets the ESP32, waits a fixed 5 s, rejoins WiFi and
+    retries once; at most 4 records are kept meanwhile.
+    """
+
+    def __init__(self, esp, clock):
+        self.esp = esp
+        self.clock = clock
+        self.session = Session(esp)
+        self.pending = []
+        self.stats = {"dropped": 0, "esp_resets": 0}
+
+    def queue(self, record):
+        if len(self.pending) >= 4:
+            self.pending.pop(0)
+            self.stats["dropped"] += 1
+        self.pending.append(record.copy())
+
+    def flush(self):
+        if len(self.pending) == 1:
+            self.session.post("http://server/status", json=self.pending[0])
+        else:
+            self.session.post("http://server/status/batch", json=self.pending)
+        sent = len(self.pending)
+        self.pending.clear()
+        return sent
+
+    def poll(self):
+        try:
+            return self.flush()
+        except SEND_ERRORS:
+            self.stats["esp_resets"] += 1
+            try:
+                self.esp.reset()
+                self.esp.disconnect()
+                self.clock.sleep(5)
+                self.esp.connect_AP("ssid", "password")
+                self.session = Session(self.esp)  # Stand-in for sockets the reset killed
+                return self.flush()
+            except SEND_ERRORS:
+                return 0
+
+def tiered_sender(esp, clock):
+    return TelemetryClient(esp, "http://server", lambda: esp.connect_AP("ssid", "password"),
+                           make_session=lambda: Session(esp), clock=clock.monotonic)
+
+def run_scenario(make_sender, fault, duration, fault_at, outage):
+    """Drive the blink loop on simulated time and watch one fault play out"""
+    clock = SimClock()
+    esp = FakeESP(clock)
+    sender = make_sender(esp, clock)
+    queued = 0
+    stall = 0.0
+    recovered_at = None
+    injected = False
+    while clock.now < duration:
+        if not injected and clock.now >= fault_at:
+            esp.inject(fault, outage)
+            injected = True
+        record = {"status": "ON" if queued % 2 == 0 else "OFF", "count": queued // 2, "board": "Metro M4 Airlift Lite",
+                  "ip_address": esp.pretty_ip(esp.ip_address), "timestamp": clock.now}
+        sender.queue(record)
+        queued += 1
+        started = clock.now
+        accepted = esp.accepted
+        sender.poll()
+        stall = max(stall, clock.now - started)
+        if injected and recovered_at is None and esp.accepted > accepted:
+            recovered_at = clock.now
+        clock.sleep(BLINK_SECONDS)
+    return {
+        "recovery_s": None if recovered_at is None else round(recovered_at - fault_at, 2),
+        "max_stall_s": round(stall, 2),
+        "esp_resets": esp.resets,
+        "queued": queued,
+        "delivered": esp.accepted,
+        "dropped": sender.stats["dropped"],
+        "still_buffered": len(sender.pending),
+    }
+
+def run_throughput(records, reuse):
+    """Real posts through TelemetryClient to a local server, records per second"""
+    server = ServerProcess(['--device-rate', '0', '--global-rate', '0', '--log-level', 'WARNING'])
+    server.start()
+    try:
+        esp = FakeESP(SimClock())
+        address = ('127.0.0.1', server.http_port)
+        client = TelemetryClient(esp, f"http://127.0.0.1:{server.http_port}", lambda: None,
+                                 make_session=lambda: Session(esp, address, reuse))
+        started = time.perf_counter()
+        for count in range(records):
+            client.queue({"status": "ON" if count % 2 else "OFF", "count": count, "board": "Metro M4 Airlift Lite",
+                          "ip_address": "192.168.1.50", "timestamp": time.time()})
+            client.poll()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+    return {"records": client.stats["sent"], "elapsed_s": round(elapsed, 3),
+            "records_per_s": round(client.stats["sent"] / elapsed, 1), "failures": client.stats["failures"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Recovery time and throughput of telemetry_client.py")
+    parser.add_argument('--scenarios', default='drop,socket,wifi,esp,outage,error', help="Comma-separated faults to inject")
+    parser.add_argument('--duration', type=float, default=300, help="Simulated seconds per scenario")
+    parser.add_argument('--outage', type=float, default=60, help="Seconds the server is down in the outage scenario")
+    parser.add_argument('--records', type=int, default=2000, help="Records posted in each throughput run (0 skips it)")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the backoff jitter")
+    parser.add_argument('--verbose', action='store_true', help="Show the client's own messages")
+    parser.add_argument('--output', help="Also write the report here as JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    report = {"recovery": {}, "throughput": {}}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        for fault in args.scenarios.split(','):
+            report["recovery"][fault] = {
+                "tiered": run_scenario(tiered_sender, fault, args.duration, 20, args.outage),
+                "legacy": run_scenario(LegacySender, fault, args.duration, 20, args.outage),
+            }
+    for fault, results in report["recovery"].items():
+        print(f"💥 {fault}")
+        for name, result in results.items():
+            print(f"   {name:7} recovered in {result['recovery_s']}s, longest stall {result['max_stall_s']}s,"
+                  f" {result['esp_resets']} ESP32 resets, {result['delivered']}/{result['queued']} delivered,"
+                  f" {result['dropped']} dropped")
+
+    if args.records:
+        with quiet:
+            for name, reuse in (("reused connection", True), ("new connection per post", False)):
+                report["throughput"][name] = run_throughput(args.records, reuse)
+        for name, result in report["throughput"].items():
+            print(f"🚀 {name}: {result['records_per_s']} records/s ({result['records']} in {result['elapsed_s']}s)")
+
+    print(f"📦 Offline buffer holds {OFFLINE_BUFFER} records")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
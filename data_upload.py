@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Bulk uploads to simple_server.py's POST /data
+
+A board can send a buffered sensor dump of any length: the body is
+parsed as it streams in and every complete record goes straight to
+disk, so the server never holds the whole upload in memory. Bodies are
+either NDJSON (one JSON value per line) or back-to-back status_wire
+records when Content-Type is application/x-m4-status.
+
+Each upload becomes one file in the data directory, written as
+<name>.part and renamed once the body has been read to the end:
+    20240101-120000-192.168.1.50-1.ndjson
+    20240101-120005-192.168.1.51-2.m4status
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+
+from status_wire import STATUS_RECORD_SIZE, decode_status
+
+DATA_MAX_LINE = 64 * 1024  # Longest NDJSON line accepted (bytes)
+
+class UploadParser:
+    """Split a streamed body into records, checking each one as it completes
+
+    feed() returns the records completed by a chunk, ready to be stored.
+    Lines that are not JSON, or longer than DATA_MAX_LINE, are dropped and
+    counted in rejected; a bad status record fails the whole upload.
+    """
+
+    def __init__(self, binary, loads=json.loads):
+        self.binary = binary
+        self.loads = loads
+        self.buffer = bytearray()  # Start of a record that hasn't fully arrived
+        self.skipping = False  # Discarding an overlong line up to its newline
+        self.records = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.crc32 = 0  # Of the whole body, so the board can check what arrived
+
+    def feed(self, chunk):
+        self.bytes += len(chunk)
+        self.crc32 = zlib.crc32(chunk, self.crc32)
+        self.buffer += chunk
+        if self.binary:
+            whole = len(self.buffer) - len(self.buffer) % STATUS_RECORD_SIZE
+            records = [bytes(self.buffer[offset:offset + STATUS_RECORD_SIZE])
+                       for offset in range(0, whole, STATUS_RECORD_SIZE)]
+            del self.buffer[:whole]
+            for record in records:
+                decode_status(record)  # Raises ValueError for a record version we can't read
+        else:
+            if self.skipping:
+                newline = self.buffer.find(b'\n')
+                if newline < 0:
+                    self.buffer.clear()
+                    return []
+                del self.buffer[:newline + 1]
+                self.skipping = False
+            end = self.buffer.rfind(b'\n') + 1
+            records = [line + b'\n' for line in self.buffer[:end].splitlines() if self.check_line(line)]
+            del self.buffer[:end]
+            if len(self.buffer) > DATA_MAX_LINE:
+                self.buffer.clear()
+                self.skipping = True
+                self.rejected += 1
+        self.records += len(records)
+        return records
+
+    def check_line(self, line):
+        """Whether an NDJSON line holds a JSON value; blank lines are skipped quietly"""
+        if not line.strip():
+            return False
+        if len(line) > DATA_MAX_LINE:
+            self.rejected += 1
+            return False
+        try:
+            self.loads(line)
+        except ValueError:
+            self.rejected += 1
+            return False
+        return True
+
+    def finish(self):
+        """Records left at the end of the body: a final line without a newline"""
+        if self.binary:
+            if self.buffer:
+                raise ValueError("body is not a whole number of status records")
+            return []
+        line = bytes(self.buffer)
+        self.buffer.clear()
+        if self.skipping or not self.check_line(line):
+            return []
+        self.records += 1
+        return [line + b'\n']
+
+class UploadStore:
+    """Directory that uploads are written into, one file per upload"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.uploads = 0
+        self.lock = threading.Lock()  # open() runs in the server's executor threads
+
+    def open(self, peer, binary):
+        """Start a new upload file for a sender"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            self.uploads += 1
+            number = self.uploads
+        name = "%s-%s-%d.%s" % (time.strftime('%Y%m%d-%H%M%S'), peer.replace(':', '_'), number,
+                                'm4status' if binary else 'ndjson')
+        return UploadFile(os.path.join(self.directory, name))
+
+class UploadFile:
+    """One upload being written; only committed uploads keep their final name"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path + '.part', 'wb')
+
+    def write(self, records):
+        self.file.writelines(records)
+
+    def commit(self):
+        """Flush the upload and give it its final name"""
+        self.file.close()
+        os.replace(self.path + '.part', self.path)
+
+    def abort(self):
+        """Throw away an upload that was cut short or rejected"""
+        self.file.close()
+        os.remove(self.path + '.part')
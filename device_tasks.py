@@ -0,0 +1,162 @@
+# Cooperative device loop for the Metro M4: the NeoPixel blinks on a fixed
+# schedule while status updates and WiFi trouble are handled in between
+# Works on CircuitPython (with the asyncio library from the bundle) and
+# CPython (bench/device_loop_sim.py runs it against stub board modules)
+#
+# Three tasks share one event loop:
+#   blink      toggles the LED at fixed deadlines and queues a status record
+#   send       polls the telemetry client right after each toggle
+#   supervise  watches the WiFi link, rejoins it and resets a hung ESP32
+# The queue between blink and send is the client's StatusBuffer. It is
+# bounded and drops its oldest record when full, so an outage never holds
+# up the LED or grows the heap.
+#
+# esp32spi calls block, so nothing can run during one, toggles included.
+# Instead blink keeps an absolute schedule, so a late toggle doesn't push
+# back the ones after it, and the slow calls start right after a toggle,
+# when there is the most time before the next one. A rejoin doesn't wait
+# inside connect_AP(): the join is started and its progress checked
+# between toggles. An ESP32 reset is likewise done by the supervisor just
+# after a toggle instead of in the middle of a failed send.
+
+import asyncio
+import time
+
+try:
+    from telemetry_client import SEND_ERRORS
+except ImportError:
+    SEND_ERRORS = (ValueError, RuntimeError, ConnectionError, OSError)
+
+WL_CONNECTED = 3  # adafruit_esp32spi status once the ESP32 has joined
+JOIN_TIMEOUT = 20  # Seconds a join may take before the ESP32 is reset
+JOIN_POLL = 0.5  # Seconds between checks on a join in progress
+SUPERVISE_SECONDS = 10  # Seconds between link checks while online
+
+class DeviceLoop:
+    """LED, telemetry and connection tasks for one board
+
+    show(on, count) drives the LED. client is a TelemetryClient with a
+    StatusBuffer, built with this loop's request_join as its connect and
+    request_reset as its reset, so a failed send hands WiFi trouble to
+    the supervisor instead of handling it inline; set it before run().
+    on_join(), if given, runs after every join.
+    """
+
+    def __init__(self, esp, ssid, password, show, client=None, blink_seconds=2, on_join=None, clock=time.monotonic):
+        self.esp = esp
+        self.client = client
+        self.ssid = ssid
+        self.password = password
+        self.show = show
+        self.blink_seconds = blink_seconds
+        self.on_join = on_join
+        self.clock = clock
+        self.online = True  # The board joined WiFi before the loop started
+        self.reset_wanted = False
+        self.join_wanted = asyncio.Event()
+        self.toggled = asyncio.Event()  # Set and cleared at once by each toggle, waking whoever waits
+        self.blink_count = 0
+        self.stats = {"toggles": 0, "skipped": 0, "max_late": 0.0, "joins": 0, "esp_resets": 0}
+
+    def request_join(self):
+        """connect() for the client: take the board offline until the supervisor rejoins"""
+        self.online = False
+        self.join_wanted.set()
+
+    def request_reset(self):
+        """reset() for the client: the supervisor resets the ESP32 after the next toggle"""
+        self.reset_wanted = True
+        self.request_join()
+
+    async def run(self):
+        await asyncio.gather(self.send(), self.supervise(), self.blink())  # Blink last: the others wait for its first toggle
+
+    async def blink(self):
+        """Toggle the LED on an absolute schedule and queue each new status"""
+        deadline = self.clock()
+        on = False
+        while True:
+            late = self.clock() - deadline
+            on = not on
+            self.show(on, self.blink_count)
+            self.client.queue_status("ON" if on else "OFF", self.blink_count, time.time())
+            if not on:
+                self.blink_count += 1
+            self.toggled.set()
+            self.toggled.clear()
+            self.stats["toggles"] += 1
+            self.stats["max_late"] = max(self.stats["max_late"], late)
+            deadline += self.blink_seconds
+            while deadline <= self.clock():
+                deadline += self.blink_seconds  # Held up for a whole period: skip, don't catch up
+                self.stats["skipped"] += 1
+            await asyncio.sleep(max(0, deadline - self.clock()))
+
+    async def send(self):
+        """Send whatever the client has due, right after each toggle"""
+        while True:
+            await self.toggled.wait()
+            if not self.online:
+                continue  # Records stay buffered until the supervisor rejoins
+            try:
+                sent = self.client.poll()
+            except Exception as e:
+                # The client handles failed sends; anything else means the ESP32 is stuck
+                print(f"❌ Error while sending: {e}")
+                self.request_reset()
+                continue
+            if sent:
+                print("✅ Status sent, records:", sent)
+
+    async def supervise(self):
+        """Check the link now and then; rejoin or reset when asked or when it drops"""
+        while True:
+            try:
+                await asyncio.wait_for(self.join_wanted.wait(), SUPERVISE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if self.join_wanted.is_set() or not self.link_up():
+                await self.join()
+
+    def link_up(self):
+        try:
+            if self.esp.is_connected:
+                return True
+            print("📶 WiFi dropped")
+        except SEND_ERRORS as e:
+            print(f"⚠️ ESP32 not answering ({e})")
+            self.reset_wanted = True
+        self.online = False
+        return False
+
+    async def join(self):
+        """Rejoin WiFi without blocking the LED, resetting the ESP32 when needed"""
+        self.online = False
+        while True:
+            self.join_wanted.clear()
+            try:
+                if self.reset_wanted:
+                    await self.toggled.wait()
+                    print("🔄 Resetting ESP32...")
+                    self.stats["esp_resets"] += 1
+                    self.reset_wanted = False
+                    self.esp.reset()
+                print(f"📶 Joining WiFi: {self.ssid}")
+                self.esp.wifi_set_passphrase(self.ssid, self.password)
+                started = self.clock()
+                while self.clock() - started < JOIN_TIMEOUT:
+                    await asyncio.sleep(JOIN_POLL)
+                    if self.esp.status == WL_CONNECTED:
+                        break
+                else:
+                    raise ConnectionError("join timed out")
+            except SEND_ERRORS as e:
+                print(f"⚠️ WiFi join failed ({e}), resetting ESP32")
+                self.reset_wanted = True
+                continue
+            self.stats["joins"] += 1
+            if self.on_join is not None:
+                self.on_join()
+            print("✅ WiFi joined")
+            self.online = True
+            return
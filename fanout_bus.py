@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Inter-process fan-out bus for simple_server.py workers
+
+Each worker binds a Unix datagram socket in a shared directory. A worker
+that accepts a status update sends it once to every peer socket; peers
+apply it to their own device registry and fan it out to the viewers
+connected to them. No broker process sits in the middle, so one hop
+separates ingest on any worker from delivery on every other worker.
+"""
+
+import os
+import socket
+
+BUS_MAX_MESSAGE = 64 * 1024  # Largest update accepted from a peer (bytes)
+
+def socket_path(directory, index):
+    return os.path.join(directory, f"worker-{index}.sock")
+
+class FanoutBus:
+    """Unix datagram sockets linking the worker processes"""
+
+    def __init__(self, directory, index, workers, on_message):
+        self.index = index
+        self.path = socket_path(directory, index)
+        self.peers = [socket_path(directory, peer) for peer in range(workers) if peer != index]
+        self.on_message = on_message  # Called with the raw bytes from a peer
+        self.sock = None
+        self.loop = None
+        self.dropped = 0  # Sends a peer could not take (not started yet, or backed up)
+
+    def start(self, loop):
+        """Bind our socket and start reading peer updates on the event loop"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.loop = loop
+        loop.add_reader(self.sock.fileno(), self._read)
+
+    def publish(self, data):
+        """Send an encoded update to every other worker without blocking"""
+        for peer in self.peers:
+            try:
+                self.sock.sendto(data, peer)
+            except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+                self.dropped += 1
+
+    def _read(self):
+        while True:
+            try:
+                data = self.sock.recv(BUS_MAX_MESSAGE)
+            except BlockingIOError:
+                return
+            self.on_message(data)
+
+    def close(self):
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
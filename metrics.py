@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus-style metrics for simple_server.py
+
+Counters, gauges and fixed-bucket histograms cheap enough to update on
+every request: an update is an attribute increment, plus a bisect for
+histograms. Values that are easy to read at scrape time (queue depths,
+client counts, device ages) come from collector callbacks instead of
+being maintained on the hot path.
+"""
+
+from bisect import bisect_left
+
+# Seconds; spans sub-millisecond handler work up to multi-second stalls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def format_labels(names, values):
+    """{a="x",b="y"} for a sample line, or '' without labels"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for a named metric with optional labels"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}  # label values -> child
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Child metric for one combination of label values"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self.children.items():
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{format_labels(labelnames, values)} {format_value(self.value)}"]
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].value += amount
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.children[()].value = value
+
+    def inc(self, amount=1):
+        self.children[()].value += amount
+
+    def dec(self, amount=1):
+        self.children[()].value -= amount
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            labels = format_labels(labelnames + ('le',), values + (format_value(float(bound)),))
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+class Registry:
+    """All metrics and scrape-time collectors of one process"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        """collector() returns extra exposition lines, computed at scrape time"""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+def gauge_lines(name, documentation, samples, labelnames=()):
+    """Exposition lines for a gauge computed at scrape time
+
+    samples is an iterable of (label values, value).
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for values, value in samples:
+        lines.append(f"{name}{format_labels(labelnames, values)} {format_value(value)}")
+    return lines
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Asynchronous, level-filtered, rate-limited logging for simple_server.py
+
+Hot paths call e.g. log.debug("📡 %s %s", device_id, status) with lazy
+%-style arguments, so a message below the configured level costs one
+cached level check and nothing is formatted. Messages that pass the level
+are sampled and rate limited per logger (one logger per message type:
+m4.websocket, m4.ingest, m4.http and m4.fanout), then handed unformatted
+to a bounded queue. A background thread formats them and writes them to
+stdout.
+"""
+
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname).1s %(name)s %(message)s'
+LOG_QUEUE_SIZE = 10000  # Records buffered for the writer thread before dropping
+
+def get_logger(kind):
+    """Logger for one message type, e.g. get_logger('ingest') -> m4.ingest"""
+    return logging.getLogger(f'm4.{kind}')
+
+class SamplingRateLimitFilter(logging.Filter):
+    """Keep 1 in sample_every records and at most rate per second per logger
+
+    Warnings and errors are never sampled or limited. When a logger's
+    messages were dropped, the next one that gets through says how many.
+    """
+
+    def __init__(self, rate=20.0, burst=50, sample_every=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every or {}  # logger name -> N
+        self.state = {}  # logger name -> [tokens, last refill, seen, suppressed]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        state = self.state.get(record.name)
+        if state is None:
+            state = self.state[record.name] = [self.burst, time.monotonic(), 0, 0]
+
+        state[2] += 1
+        every = self.sample_every.get(record.name, 1)
+        if every > 1 and state[2] % every:
+            return False
+
+        now = time.monotonic()
+        state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        if state[0] < 1:
+            state[3] += 1
+            return False
+        state[0] -= 1
+        if state[3]:
+            record.msg = f"{record.msg} (+{state[3]} suppressed)"
+            state[3] = 0
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock handler formats here, on the caller's thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(level='INFO', rate=20.0, burst=50, sample_every=None, stream=None):
+    """Route m4.* loggers through the queue; returns the started listener"""
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingRateLimitFilter(rate, burst, sample_every))
+
+    root = logging.getLogger('m4')
+    root.setLevel(level)
+    root.handlers[:] = [handler]
+    root.propagate = False
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT, '%H:%M:%S'))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    return listener
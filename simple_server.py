@@ -4,98 +4,1301 @@ Real-time WebSocket Server for Metro M4 Airlift Lite
 Run this on your Mac for real-time sensor data display
 """
 
+import argparse
 import asyncio
 import websockets
+import gzip
+import hashlib
+import heapq
+import hmac
+import itertools
 import json
-from datetime import datetime
-import threading
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
 import time
-import http.server
-import socketserver
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
 import socket
 
+try:
+    import brotli  # Optional: pip install brotli for br-encoded dashboard responses
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # Optional: pip install orjson for faster status decoding and encoding
+except ImportError:
+    orjson = None
+
+import metrics
+from data_upload import UploadParser, UploadStore
+from fanout_bus import FanoutBus
+from server_log import configure_logging, get_logger
+from status_log import StatusLog, replay_directory
+from status_wire import STATUS_CONTENT_TYPE, decode_datagram, decode_status_records
+from timer_wheel import TimerWheel
+from traffic_capture import CAPTURE_PATHS, CaptureWriter
+
 # Configuration
 WS_PORT = 8765  # WebSocket port
+UDP_PORT = 8766  # UDP port for fire-and-forget status datagrams
 HTTP_PORT = 8000  # HTTP port for the web page
 HOST = '0.0.0.0'  # Listen on all interfaces
+HTTP_IDLE_TIMEOUT = 60  # Seconds a keep-alive connection may sit idle
+HTTP_BODY_TIMEOUT = 30  # Seconds a streamed request body may go without sending anything
+HTTP_MAX_BODY = 1024 * 1024  # Largest request body accepted (bytes)
+HTTP_READ_SIZE = 64 * 1024  # Bytes read at a time from a streamed request body
+DATA_DIR = 'data_uploads'  # Where POST /data uploads are stored (None only counts them)
+DATA_MAX_BODY = 64 * 1024 * 1024  # Largest POST /data upload accepted (bytes)
+DASHBOARD_MAX_AGE = 86400  # Seconds browsers may reuse the dashboard shell before revalidating
+CLIENT_QUEUE_LIMIT = 64  # Messages buffered per WebSocket client before conflating
+CLIENT_MAX_LAG = 30  # Seconds a client may stay conflated before it is dropped
+RESUME_BUFFER_SIZE = 1024  # Recent broadcasts kept so reconnecting clients can catch up
+SSE_KEEPALIVE = 15  # Seconds between comment lines on an idle /events stream
+SSE_RETRY = 2000  # Milliseconds EventSource waits before reconnecting
+HISTORY_SIZE = 4096  # Updates kept per device (~2.3 hours of 4 s blinking)
+HISTORY_INITIAL = 64  # Slots a new device's history starts with; doubles as it fills, up to HISTORY_SIZE
+MAX_DEVICES = 10000  # Boards tracked at once; a new one beyond this evicts the longest-silent board
+HISTORY_MAX_POINTS = 1000  # Most points a /history query returns
+HISTORY_MAX_BACKDATE = 3600  # Seconds a board's own timestamp may trail arrival and still place it in history
+STATUS_LOG_DIR = 'status_log'  # Durable status log directory (None disables it)
+TRAFFIC_CAPTURE = None  # File to record POST /status, /status/batch and /data traffic into (None disables it)
+UDP_WINDOW = 64  # Datagrams tracked behind the newest for reorder/duplicate detection
+UDP_RESTART_GAP = 1024  # A sequence this far behind means the board restarted
+DEVICE_UPLINK_PATH = '/device'  # WebSocket path boards use for their uplink
+DEVICE_TOKEN = None  # Shared secret boards send in their hello (None accepts any board)
+DEVICE_HELLO_TIMEOUT = 10  # Seconds a board has to authenticate
+WORKERS = 1  # Processes sharing the ports via SO_REUSEPORT (Linux only)
+DEVICE_RATE = 5.0  # Status updates per second one board may sustain (0 disables the limit)
+DEVICE_BURST = 20  # Updates one board may send back to back before DEVICE_RATE applies
+GLOBAL_RATE = 5000.0  # Status updates per second across all boards (0 disables the limit)
+GLOBAL_BURST = 10000  # Updates all boards together may send back to back
+BROADCAST_MIN_INTERVAL = 0.1  # Seconds between fan-outs for one board; faster updates are coalesced
+REPORT_INTERVAL = 2.0  # Seconds expected between a board's reports until its own pace is learned
+STALE_AFTER = 3  # Report intervals a board may miss before it is shown as stale
+OFFLINE_AFTER = 10  # Report intervals a board may miss before it is shown as offline
+LIVENESS_TICK = 0.5  # Seconds between liveness watchdog passes
+STATUS_MAX_TEXT = 64  # Longest device_id, group, status, board or ip_address accepted
 
 # Global variables
-latest_neopixel_status = {
+NO_STATUS = {
     "status": "Unknown",
     "count": 0,
     "board": "Metro M4 Airlift Lite",
     "ip_address": "Unknown",
     "timestamp": 0
-}
+}  # What viewers see before any board has reported
+latest_record = None  # DeviceRecord of the board that reported most recently
+
+# JSON codec for status traffic: orjson when installed, otherwise the standard library
+if orjson is not None:
+    json_loads = orjson.loads
+    json_bytes = orjson.dumps
+else:
+    json_loads = json.loads
+    
+    def json_bytes(data):
+        """Compact UTF-8 JSON, the same bytes orjson would produce"""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+def with_fields(payload, **fields):
+    """Append fields to an encoded JSON object without decoding it again"""
+    return payload[:-1] + b',' + json_bytes(fields)[1:]
+
+# Logging; one logger per message type so each can be sampled and rate limited
+LOG_LEVEL = 'INFO'  # DEBUG shows every status update, ping and request
+LOG_RATE_LIMIT = 20  # Messages per second per logger (warnings and errors are exempt)
+LOG_SAMPLE_EVERY = {}  # Logger -> keep 1 in N of its messages, e.g. {'ingest': 10}
+ws_log = get_logger('websocket')
+ingest_log = get_logger('ingest')
+http_log = get_logger('http')
+fanout_log = get_logger('fanout')
+
+# Hot-path instrumentation, exposed on GET /metrics
+HTTP_REQUESTS = metrics.Counter('m4_http_requests_total', 'HTTP requests by route', ('method', 'path', 'code'))
+POST_LATENCY = metrics.Histogram('m4_post_handler_seconds', 'Time spent handling POST requests', ('path',))
+INGEST_UPDATES = metrics.Counter('m4_ingest_updates_total', 'Status updates accepted by ingest path', ('source',))
+FANOUT_SECONDS = metrics.Histogram('m4_fanout_seconds', 'Time to queue one update for every subscriber')
+SEND_FAILURES = metrics.Counter('m4_websocket_send_failures_total', 'WebSocket sends that failed')
+CLIENT_CONFLATED = metrics.Counter('m4_client_conflated_messages_total',
+                                   'Updates replaced by a newer one for the same board in a slow viewer queue', ('transport',))
+SLOW_DISCONNECTS = metrics.Counter('m4_websocket_slow_disconnects_total', 'Clients dropped for lagging too long')
+RATE_LIMITED = metrics.Counter('m4_ingest_rate_limited_total', 'Status updates rejected by admission control', ('source',))
+COALESCED = metrics.Counter('m4_broadcasts_coalesced_total', 'Updates replaced by a newer one from the same board before fan-out')
+DATA_RECORDS = metrics.Counter('m4_data_records_total', 'Records in POST /data uploads', ('result',))
+DATA_BYTES = metrics.Counter('m4_data_bytes_total', 'Body bytes read from POST /data uploads')
+
+# Per-device state, keyed by device id
+DEFAULT_GROUP = 'default'
+devices = OrderedDict()  # Least recently heard from first
+
+class StatusUpdate:
+    """One validated status update; fields the board left out are None"""
+    __slots__ = ('device_id', 'group', 'status', 'count', 'board', 'ip_address', 'timestamp')
+    
+    def __init__(self, device_id, group=None, status=None, count=None, board=None, ip_address=None, timestamp=None):
+        self.device_id = device_id  # Always set: the identity the update is filed under
+        self.group = group
+        self.status = status
+        self.count = count
+        self.board = board
+        self.ip_address = ip_address
+        self.timestamp = timestamp
+
+def status_text(data, key):
+    """Optional short string field"""
+    value = data.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    if len(value) > STATUS_MAX_TEXT:
+        raise ValueError(f"{key} is longer than {STATUS_MAX_TEXT} characters")
+    return value
+
+def parse_status_update(data):
+    """Validate a decoded status object in one pass; raises ValueError
+    
+    Every ingest path (JSON, binary records, UDP, the device uplink and
+    the fan-out bus) goes through here, so nothing downstream has to
+    guess at types. Unknown keys are ignored.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("status must be a JSON object")
+    count = data.get('count')
+    if count is not None and (type(count) is not int or not -2**63 <= count < 2**63):
+        raise ValueError("count must be a 64-bit integer")
+    timestamp = data.get('timestamp')
+    if timestamp is not None and (type(timestamp) not in (int, float) or not math.isfinite(timestamp)):
+        raise ValueError("timestamp must be a number")
+    if type(data.get('device_id')) is int:
+        data['device_id'] = str(data['device_id'])  # Boards may number themselves
+    update = StatusUpdate(status_text(data, 'device_id'), status_text(data, 'group'), status_text(data, 'status'),
+                          count, status_text(data, 'board'), status_text(data, 'ip_address'), timestamp)
+    update.device_id = update.device_id or update.ip_address or update.board or 'unknown'
+    return update
+
+class DeviceRecord:
+    """Latest known state of one board"""
+    __slots__ = ('device_id', 'group', 'status', 'count', 'board', 'ip_address', 'timestamp', 'last_seen',
+                 'interval', 'liveness', 'encoded')
+    
+    def __init__(self, device_id, group=DEFAULT_GROUP):
+        self.device_id = device_id
+        self.group = group
+        self.status = "Unknown"
+        self.count = 0
+        self.board = "Unknown"
+        self.ip_address = "Unknown"
+        self.timestamp = 0
+        self.last_seen = 0  # Server time.time() of the latest update
+        self.interval = REPORT_INTERVAL  # Smoothed seconds between reports
+        self.liveness = "online"  # online, stale or offline
+        self.encoded = None  # Cached encode(); cleared whenever a field changes
+    
+    def update(self, update):
+        """Copy the fields a StatusUpdate carries into this record"""
+        if update.group is not None:
+            self.group = update.group
+        if update.status is not None:
+            self.status = update.status
+        if update.count is not None:
+            self.count = update.count
+        if update.board is not None:
+            self.board = update.board
+        if update.ip_address is not None:
+            self.ip_address = update.ip_address
+        if update.timestamp is not None:
+            self.timestamp = update.timestamp
+        self.encoded = None
+    
+    def to_dict(self):
+        """Status message as sent to WebSocket clients"""
+        return {
+            "device_id": self.device_id,
+            "group": self.group,
+            "status": self.status,
+            "count": self.count,
+            "board": self.board,
+            "ip_address": self.ip_address,
+            "timestamp": self.timestamp,
+            "liveness": self.liveness
+        }
+    
+    def encode(self):
+        """to_dict() as compact JSON bytes, encoded once per change"""
+        if self.encoded is None:
+            self.encoded = json_bytes(self.to_dict())
+        return self.encoded
+
+# Status strings are stored in history as small integer codes
+status_names = ["Unknown", "OFF", "ON"]
+status_codes = {name: code for code, name in enumerate(status_names)}
+
+def status_code(status):
+    """Small integer code for a status string, allocating one if needed"""
+    code = status_codes.get(status)
+    if code is None:
+        if len(status_names) >= 256:
+            return 0  # Table full, record as Unknown
+        code = status_codes[status] = len(status_names)
+        status_names.append(status)
+    return code
+
+class DeviceHistory:
+    """Ring buffer of one device's status updates, up to size points
+    
+    Columns live in typed arrays, so a full buffer costs
+    17 bytes per point no matter how long the server runs.
+    The arrays start small and double until they reach size.
+    """
+    __slots__ = ('size', 'timestamps', 'codes', 'counts', 'start', 'length')
+    
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        initial = min(size, HISTORY_INITIAL)
+        self.timestamps = array('d', bytes(8 * initial))
+        self.codes = array('B', bytes(initial))
+        self.counts = array('q', bytes(8 * initial))
+        self.start = 0  # Physical index of the oldest point
+        self.length = 0
+    
+    def grow(self):
+        """Double the arrays; only called before the ring first wraps, while start is 0"""
+        extra = min(self.size, 2 * len(self.timestamps)) - len(self.timestamps)
+        self.timestamps.frombytes(bytes(8 * extra))
+        self.codes.frombytes(bytes(extra))
+        self.counts.frombytes(bytes(8 * extra))
+    
+    def append(self, timestamp, status, count):
+        """Record one update, overwriting the oldest once full"""
+        if self.length == len(self.timestamps) < self.size:
+            self.grow()
+        size = len(self.timestamps)
+        if self.length < size:
+            index = (self.start + self.length) % size
+            self.length += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % size
+        self.timestamps[index] = timestamp
+        self.codes[index] = status_code(status)
+        self.counts[index] = count
+    
+    def newest(self):
+        """Timestamp of the latest point, or None while empty"""
+        if not self.length:
+            return None
+        return self.timestamps[(self.start + self.length - 1) % len(self.timestamps)]
+    
+    def _bisect(self, timestamp, right=False):
+        """First logical position past timestamp (>= it, or > it when right)"""
+        size = len(self.timestamps)
+        lo, hi = 0, self.length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.timestamps[(self.start + mid) % size]
+            if value < timestamp or (right and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def query(self, start_time, end_time, max_points):
+        """Points in [start_time, end_time], thinned to at most max_points
+        
+        The window is found by binary search. A longer one is cut into
+        equal time buckets, each reduced to its last point, preceded by the
+        last point of the other status when the board switched within the
+        bucket, so thinning never hides an ON/OFF change.
+        """
+        size = len(self.timestamps)
+        lo = self._bisect(start_time)
+        hi = max(lo, self._bisect(end_time, right=True))
+        total = hi - lo
+        if total <= max_points:
+            positions = range(lo, hi)
+        else:
+            positions = []
+            buckets = max(1, max_points // 2)
+            first_time = self.timestamps[(self.start + lo) % size]
+            width = (self.timestamps[(self.start + hi - 1) % size] - first_time) / buckets
+            first = lo
+            for bucket in range(1, buckets + 1):
+                last = hi if bucket == buckets else self._bisect(first_time + bucket * width)
+                if last > first:
+                    end = last - 1
+                    code = self.codes[(self.start + end) % size]
+                    for position in range(end - 1, first - 1, -1) if max_points > 1 else ():
+                        if self.codes[(self.start + position) % size] != code:
+                            positions.append(position)
+                            break
+                    positions.append(end)
+                    first = last
+        timestamps, statuses, counts = [], [], []
+        for position in positions:
+            index = (self.start + position) % size
+            timestamps.append(self.timestamps[index])
+            statuses.append(status_names[self.codes[index]])
+            counts.append(self.counts[index])
+        return total, timestamps, statuses, counts
+
+# Ring buffer of recent updates for each device
+device_history = {}  # device_id -> DeviceHistory
+
+# Durable log of accepted updates; opened in main()
+status_log = None
+
+# Link to the other worker processes when running with --workers
+fanout_bus = None
+
+# Recording of incoming status traffic for bench/replay_capture.py; opened in main()
+traffic_capture = None
+
+# Directory POST /data uploads are written to; opened in main()
+upload_store = None
+
+def device_record(device_id):
+    """A device's record, created along with its history if it is new
+    
+    At MAX_DEVICES the board that has been silent longest, the first in
+    devices, is forgotten to make room, so a stream of made-up ids can't
+    grow memory forever.
+    """
+    record = devices.get(device_id)
+    if record is None:
+        if len(devices) >= MAX_DEVICES:
+            idle = next(iter(devices.values()))
+            ingest_log.info("🗑️ Forgetting %s to make room for %s (%d devices tracked)",
+                            idle.device_id, device_id, len(devices))
+            forget_device(idle.device_id)
+        record = devices[device_id] = DeviceRecord(device_id)
+        device_history[device_id] = DeviceHistory()
+    return record
+
+def forget_device(device_id):
+    """Drop everything kept for one device"""
+    global latest_record
+    record = devices.pop(device_id, None)
+    if record is not None and record is latest_record:
+        latest_record = None
+    device_history.pop(device_id, None)
+    device_buckets.pop(device_id, None)
+    datagram_stats.pop(device_id, None)
+    pending_broadcasts.pop(device_id, None)
+    last_broadcast.pop(device_id, None)
+    liveness_wheel.cancel(device_id)
+
+def restore_state(directories):
+    """Rebuild device records and history by replaying status logs
+    
+    With several workers each writes its own log; the logs are merged
+    by arrival time and anything older than what a device already has
+    is skipped.
+    """
+    global latest_record
+    newest = None
+    replayed = 0
+    for received_at, device_id, group, status, count, board, ip_address, timestamp in heapq.merge(
+            *[replay_directory(directory) for directory in directories]):
+        record = device_record(device_id)
+        if received_at < record.last_seen:
+            continue
+        record.group = group
+        record.status = status
+        record.count = count
+        record.board = board
+        record.ip_address = ip_address
+        record.timestamp = timestamp
+        record.last_seen = received_at
+        devices.move_to_end(device_id)
+        history = device_history[device_id]
+        history.append(history_time(history, timestamp or None, received_at), status, count)
+        newest = record
+        replayed += 1
+    if newest is not None:
+        latest_record = newest
+    return replayed
+
+# Each board's next liveness deadline
+liveness_wheel = TimerWheel(LIVENESS_TICK)
+
+def history_time(history, timestamp, received_at):
+    """When a sample belongs in a board's history
+    
+    A batch carries samples the board buffered while it couldn't send,
+    so its own timestamp is used when it is plausible: not in the future,
+    at most HISTORY_MAX_BACKDATE old, and not older than the newest point
+    history already holds, which keeps the ring in order. Otherwise, e.g.
+    a board whose clock was never set, the arrival time is used.
+    """
+    if timestamp is None or timestamp > received_at or received_at - timestamp > HISTORY_MAX_BACKDATE:
+        return received_at
+    newest = history.newest()
+    if newest is not None and timestamp < newest:
+        return received_at
+    return timestamp
+
+def learn_interval(record, received_at):
+    """Fold the gap since a board's previous report into its expected interval
+    
+    Gaps shorter than the broadcast interval are one batch, not the board's
+    pace, and an offline board's gap is an outage.
+    """
+    gap = received_at - record.last_seen
+    if record.last_seen and record.liveness != 'offline' and gap >= BROADCAST_MIN_INTERVAL:
+        record.interval += (gap - record.interval) / 4
+
+def check_liveness(record, now):
+    """Set a board's liveness from how long it has been silent; True if it changed
+    
+    Also schedules the watchdog for the board's next deadline.
+    """
+    silent = now - record.last_seen
+    if silent >= OFFLINE_AFTER * record.interval:
+        liveness = 'offline'
+        liveness_wheel.cancel(record.device_id)
+    elif silent >= STALE_AFTER * record.interval:
+        liveness = 'stale'
+        liveness_wheel.schedule(record.device_id, record.last_seen + OFFLINE_AFTER * record.interval)
+    else:
+        liveness = 'online'
+        liveness_wheel.schedule(record.device_id, record.last_seen + STALE_AFTER * record.interval)
+    changed = liveness != record.liveness
+    if changed:
+        record.liveness = liveness
+        record.encoded = None
+    return changed
+
+async def liveness_watchdog():
+    """Mark boards stale or offline as they miss deadlines and tell their subscribers"""
+    while True:
+        await asyncio.sleep(LIVENESS_TICK)
+        now = time.time()
+        for device_id in liveness_wheel.expire(now):
+            record = devices.get(device_id)
+            if record is not None and check_liveness(record, now):
+                ingest_log.info("💤 %s is %s, silent for %.0fs", device_id, record.liveness, now - record.last_seen)
+                schedule_broadcast(device_id, record)
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst; one token per update"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def wait_for(self, needed):
+        """Seconds until needed tokens are available, 0 if they are now
+        
+        A batch bigger than the burst goes through once the bucket is full
+        and leaves it in debt, so it can never be rejected forever.
+        """
+        return max(0.0, (min(needed, self.burst) - self.tokens) / self.rate)
+
+# Admission control for every ingest path
+device_buckets = OrderedDict()  # device_id -> TokenBucket, least recently charged first
+global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+
+def prune_buckets(now):
+    """Drop the least recently charged buckets while they have refilled
+    
+    A full bucket is no different from a new one. Each bucket is dropped
+    at most once, so this costs O(1) per call on average.
+    """
+    while device_buckets:
+        bucket = next(iter(device_buckets.values()))
+        bucket.refill(now)
+        if bucket.tokens < bucket.burst:
+            break
+        device_buckets.popitem(last=False)
+
+def admit(updates, source):
+    """Charge StatusUpdates to their boards' buckets and the global one
+    
+    Returns 0 when every record is admitted, otherwise the seconds to wait
+    before retrying. A rejected request takes no tokens, so a board that
+    backs off as told gets through on its next attempt.
+    """
+    now = time.monotonic()
+    charges = []
+    if DEVICE_RATE > 0:
+        per_device = {}
+        for update in updates:
+            per_device[update.device_id] = per_device.get(update.device_id, 0) + 1
+        for device_id, needed in per_device.items():
+            bucket = device_buckets.get(device_id)
+            if bucket is not None:
+                device_buckets.move_to_end(device_id)
+            else:
+                if len(device_buckets) >= MAX_DEVICES:
+                    prune_buckets(now)
+                    if len(device_buckets) >= MAX_DEVICES:
+                        device_buckets.popitem(last=False)  # Every bucket is in use; keep memory bounded anyway
+                bucket = device_buckets[device_id] = TokenBucket(DEVICE_RATE, DEVICE_BURST)
+            charges.append((bucket, needed))
+    if GLOBAL_RATE > 0:
+        charges.append((global_bucket, len(updates)))
+    
+    wait = 0.0
+    for bucket, needed in charges:
+        bucket.refill(now)
+        wait = max(wait, bucket.wait_for(needed))
+    if wait > 0:
+        RATE_LIMITED.labels(source).inc(len(updates))
+        ingest_log.info("🚦 Rate limited %d %s update(s) from %s, retry in %.1fs",
+                        len(updates), source, updates[0].device_id, wait)
+        return wait
+    for bucket, needed in charges:
+        bucket.tokens -= needed
+    return 0.0
 
 # WebSocket connections
 websocket_clients = set()
 
-# Queue for broadcasting updates
+# Subscription index: who wants updates for which devices
+all_subscribers = set()
+device_subscribers = {}  # device_id -> set of clients
+group_subscribers = {}  # group -> set of clients
+client_subscriptions = {}  # client -> (device ids, groups)
+
+# Outbound queue for each connected client
+client_queues = {}  # client -> ClientQueue
+
+# Every fanned-out update gets the next sequence number. The epoch is new
+# for every server process, so a resume token from an earlier run or from
+# another worker is never mistaken for one of ours
+server_epoch = None  # Set in main()
+update_seq = 0
+recent_broadcasts = deque(maxlen=RESUME_BUFFER_SIZE)  # (seq, device_id, payload)
+snapshot_cache = (None, None)  # (seq, encoded snapshot frame)
+
+def resume_point(websocket):
+    """(resuming, since) for a client connecting with ?epoch=E&since=N
+    
+    Clients resume using the epoch and seq of the last message they
+    received. resuming is False for a fresh connection; since is None
+    when the epoch isn't ours (the server restarted since) or since is
+    missing, so the client's view can't be patched up update by update.
+    """
+    query = parse_qs(urlsplit(websocket.request.path).query)
+    epoch = query.get('epoch', [None])[0]
+    if epoch is None:
+        return False, None
+    if epoch != server_epoch:
+        return True, None
+    try:
+        return True, int(query['since'][0])
+    except (KeyError, ValueError):
+        return True, None
+
+def missed_updates(since):
+    """Buffered (seq, device_id, payload) after since, or None if the buffer doesn't reach back that far"""
+    if since > update_seq:
+        return None
+    if since == update_seq:
+        return []
+    if not recent_broadcasts or recent_broadcasts[0][0] > since + 1:
+        return None
+    # Sequence numbers in the buffer are consecutive
+    return list(itertools.islice(recent_broadcasts, since + 1 - recent_broadcasts[0][0], None))
+
+def encode_snapshot(records):
+    """Snapshot frame for these records, joined from their cached encodings"""
+    head = json_bytes({"type": "snapshot", "epoch": server_epoch, "seq": update_seq})
+    return head[:-1] + b',"devices":[' + b','.join(record.encode() for record in records) + b']}'
+
+def snapshot_frame():
+    """Every board's latest status in one compact frame
+    
+    Encoded at most once per sequence number, so a reconnect storm shares
+    one encoding. Boards are ordered oldest to newest update.
+    """
+    global snapshot_cache
+    seq, frame = snapshot_cache
+    if seq != update_seq:
+        frame = encode_snapshot(list(devices.values()))
+        snapshot_cache = (update_seq, frame)
+    return frame
+
+# Queue of device ids with an update waiting for fan-out
 broadcast_queue = asyncio.Queue()
+pending_broadcasts = {}  # device_id -> DeviceRecord with an update not yet fanned out
+last_broadcast = {}  # device_id -> time.monotonic() of its last fan-out
+
+def schedule_broadcast(device_id, record):
+    """Queue a board's update for fan-out, coalescing with one still waiting
+    
+    A board fans out at most once per BROADCAST_MIN_INTERVAL and never has
+    more than one entry in broadcast_queue, so a noisy board cannot push
+    everyone else's updates further back.
+    """
+    if device_id in pending_broadcasts:
+        COALESCED.inc()
+        return
+    pending_broadcasts[device_id] = record
+    wait = last_broadcast.get(device_id, -BROADCAST_MIN_INTERVAL) + BROADCAST_MIN_INTERVAL - time.monotonic()
+    if wait > 0:
+        asyncio.get_running_loop().call_later(wait, broadcast_queue.put_nowait, device_id)
+    else:
+        broadcast_queue.put_nowait(device_id)
 
-# Thread-safe status update mechanism
-status_update_queue = []
-status_update_lock = threading.Lock()
+class ClientQueue:
+    """Bounded outbound queue and writer task for one WebSocket client
+    
+    Messages are sent in order while the client keeps up. Once
+    CLIENT_QUEUE_LIMIT messages are waiting the client is treated as slow:
+    further updates only keep the latest message per device, and if it is
+    still behind after CLIENT_MAX_LAG seconds the connection is closed.
+    """
+    __slots__ = ('websocket', 'peer', 'pending', 'latest', 'behind_since', 'wakeup', 'task', 'closed',
+                 'conflated')
+    event_stream = False  # broadcast_processor hands EventStream queues SSE frames instead
+    
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.peer = websocket.remote_address
+        self.pending = deque()  # (device_id, payload) in arrival order
+        self.latest = {}  # device_id -> newest payload while conflating
+        self.behind_since = None
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.conflated = 0  # Messages replaced by a newer one for the same device
+        self.task = asyncio.create_task(self.run())
+    
+    def put(self, device_id, payload):
+        """Queue an encoded message without waiting for the client"""
+        if self.closed:
+            return
+        if self.behind_since is None and len(self.pending) < CLIENT_QUEUE_LIMIT:
+            self.pending.append((device_id, payload))
+        else:
+            now = time.monotonic()
+            if self.behind_since is None:
+                self.behind_since = now
+                ws_log.info("🐢 Client %s fell behind, conflating updates", self.peer)
+            elif now - self.behind_since > CLIENT_MAX_LAG:
+                self.disconnect()
+                return
+            if self.latest.pop(device_id, None) is not None:
+                self.conflated += 1
+                CLIENT_CONFLATED.labels('sse' if self.event_stream else 'websocket').inc()
+            self.latest[device_id] = payload
+        self.wakeup.set()
+    
+    async def run(self):
+        """Send queued messages until the connection goes away"""
+        try:
+            while not self.closed:
+                if self.pending:
+                    _, payload = self.pending.popleft()
+                elif self.latest:
+                    device_id = next(iter(self.latest))
+                    payload = self.latest.pop(device_id)
+                else:
+                    self.behind_since = None
+                    self.wakeup.clear()
+                    await self.idle()
+                    continue
+                await self.send(payload)
+        except (websockets.exceptions.ConnectionClosed, ConnectionError):
+            SEND_FAILURES.inc()  # Server-wide: the queue goes away with its client
+    
+    async def idle(self):
+        """Wait for the next message"""
+        await self.wakeup.wait()
+    
+    async def send(self, payload):
+        await self.websocket.send(payload, text=True)
+    
+    def disconnect(self):
+        """Drop a client that has been behind for too long"""
+        ws_log.warning("✂️ Disconnecting slow client %s", self.peer)
+        SLOW_DISCONNECTS.inc()
+        self.close()
+        self.pending.clear()
+        self.latest.clear()
+        self.hang_up()
+    
+    def hang_up(self):
+        asyncio.create_task(self.websocket.close(1013, 'client too slow'))
+    
+    def close(self):
+        """Stop the writer task"""
+        self.closed = True
+        self.task.cancel()
+
+class EventStream(ClientQueue):
+    """A GET /events viewer: the same queue, written as Server-Sent Events
+    
+    There is no WebSocket protocol state and no separate writer task:
+    serve() runs the queue inside the HTTP connection's own task.
+    """
+    __slots__ = ('writer', 'device_ids', 'groups', 'last_event_id')
+    event_stream = True
+    
+    def __init__(self, device_ids, groups, last_event_id):
+        self.websocket = None
+        self.task = None
+        self.pending = deque()
+        self.latest = {}
+        self.behind_since = None
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.conflated = 0
+        self.writer = None
+        self.device_ids = device_ids
+        self.groups = groups
+        self.last_event_id = last_event_id
+    
+    async def serve(self, writer):
+        """Stream events on this connection until the viewer goes away"""
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        client_queues[self] = self
+        subscribe(self, self.device_ids, self.groups, everything=not (self.device_ids or self.groups))
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-store\r\n'
+                         b'Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n'
+                         b'retry: %d\n\n' % SSE_RETRY)
+            self.catch_up()
+            await self.run()
+        finally:
+            drop_subscriptions(self)
+            client_queues.pop(self, None)
+            self.closed = True
+    
+    def catch_up(self):
+        """Queue what a resuming viewer missed, or a snapshot of its boards"""
+        since = None
+        epoch, _, seq = (self.last_event_id or '').partition(':')
+        if epoch == server_epoch:
+            try:
+                since = int(seq)
+            except ValueError:
+                pass
+        missed = missed_updates(since) if since is not None else None
+        if missed is None:
+            self.put(None, b'event: snapshot\nid: %s:%d\ndata: %s\n\n' % (
+                server_epoch.encode(), update_seq, self.snapshot()))
+            return
+        subscribed = self.device_ids or self.groups
+        for seq, device_id, payload in missed:
+            record = devices.get(device_id)
+            if not subscribed or device_id in self.device_ids or (record is not None and record.group in self.groups):
+                self.put(device_id, sse_event(seq, payload))
+    
+    def snapshot(self):
+        """Snapshot frame for this viewer's boards"""
+        if not (self.device_ids or self.groups):
+            return snapshot_frame()
+        return encode_snapshot([record for record in devices.values()
+                                if record.device_id in self.device_ids or record.group in self.groups])
+    
+    async def idle(self):
+        """Wait for the next event, sending a comment now and then so dead viewers are noticed"""
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), SSE_KEEPALIVE)
+        except asyncio.TimeoutError:
+            await self.send(b': keepalive\n\n')
+    
+    async def send(self, payload):
+        self.writer.write(payload)
+        await self.writer.drain()
+    
+    def hang_up(self):
+        self.writer.close()
+    
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+def sse_event(seq, payload):
+    """One encoded update as a Server-Sent Event; the id resumes via Last-Event-ID"""
+    return b'id: %s:%d\ndata: %s\n\n' % (server_epoch.encode(), seq, payload)
+
+def subscribe(websocket, device_ids=(), groups=(), everything=False):
+    """Add topics to a client's subscription"""
+    subscribed_devices, subscribed_groups = client_subscriptions.setdefault(websocket, (set(), set()))
+    if everything:
+        all_subscribers.add(websocket)
+    for device_id in device_ids:
+        device_subscribers.setdefault(device_id, set()).add(websocket)
+        subscribed_devices.add(device_id)
+    for group in groups:
+        group_subscribers.setdefault(group, set()).add(websocket)
+        subscribed_groups.add(group)
+
+def unsubscribe(websocket, device_ids=(), groups=(), everything=False):
+    """Remove topics from a client's subscription"""
+    subscribed_devices, subscribed_groups = client_subscriptions.get(websocket, (set(), set()))
+    if everything:
+        all_subscribers.discard(websocket)
+    for topic, index, subscribed in ((device_ids, device_subscribers, subscribed_devices),
+                                     (groups, group_subscribers, subscribed_groups)):
+        for key in topic:
+            clients = index.get(key)
+            if clients is not None:
+                clients.discard(websocket)
+                if not clients:
+                    del index[key]
+            subscribed.discard(key)
+
+def drop_subscriptions(websocket):
+    """Forget every subscription held by a disconnected client"""
+    subscribed_devices, subscribed_groups = client_subscriptions.pop(websocket, (set(), set()))
+    unsubscribe(websocket, list(subscribed_devices), list(subscribed_groups), everything=True)
+
+def subscribers_for(device_id, group):
+    """Clients that should receive an update for this device"""
+    matched = set(all_subscribers)
+    matched.update(device_subscribers.get(device_id, ()))
+    matched.update(group_subscribers.get(group, ()))
+    return matched
+
+def subscription_ids(request, key):
+    """The "devices" or "groups" list of a subscription request; ValueError unless it is a list of strings"""
+    ids = request.get(key, [])
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise ValueError(f'"{key}" must be a list of strings')
+    return ids
+
+async def handle_subscription_message(websocket, request):
+    """Apply a subscribe/unsubscribe request and reply with the result"""
+    action = request.get('action')
+    try:
+        device_ids = subscription_ids(request, 'devices')
+        groups = subscription_ids(request, 'groups')
+    except ValueError as e:
+        await websocket.send(json.dumps({"type": "error", "error": str(e)}))
+        return
+    everything = bool(request.get('all', False))
+    
+    if action == 'subscribe':
+        if request.get('replace', False):
+            drop_subscriptions(websocket)
+        subscribe(websocket, device_ids, groups, everything)
+    elif action == 'unsubscribe':
+        unsubscribe(websocket, device_ids, groups, everything)
+    else:
+        await websocket.send(json.dumps({"type": "error", "error": f"unknown action: {action}"}))
+        return
+    
+    subscribed_devices, subscribed_groups = client_subscriptions.get(websocket, (set(), set()))
+    await websocket.send(json.dumps({
+        "type": "subscribed",
+        "all": websocket in all_subscribers,
+        "devices": sorted(subscribed_devices),
+        "groups": sorted(subscribed_groups)
+    }))
+    
+    # Bring the client up to date on everything it just subscribed to, queued behind any live update
+    if action == 'subscribe':
+        queue = client_queues[websocket]
+        for record in devices.values():
+            if websocket in subscribers_for(record.device_id, record.group):
+                queue.put(record.device_id, record.encode())
 
 # WebSocket handler
 async def websocket_handler(websocket):
-    """Handle WebSocket connections for real-time updates"""
-    print(f"🔌 New WebSocket connection from {websocket.remote_address}")
+    """Handle WebSocket connections for real-time updates
+    
+    Clients start subscribed to every device. To narrow that down send e.g.
+    {"action": "subscribe", "replace": true, "devices": ["192.168.1.50"]}
+    or {"action": "subscribe", "groups": ["lab"]}; "unsubscribe" works the
+    same way and {"all": true} covers the whole fleet.
+    
+    Every update carries "seq", and the first frame carries "epoch" too. A
+    client reconnecting with ?epoch=E&since=N gets just the updates it
+    missed, or a {"type": "snapshot"} of every board when too many were
+    or E is from before a server restart.
+    """
+    if websocket.request.path == DEVICE_UPLINK_PATH:
+        await device_uplink_handler(websocket)
+        return
+    
+    ws_log.info("🔌 New WebSocket connection from %s", websocket.remote_address)
     websocket_clients.add(websocket)
+    client_queues[websocket] = ClientQueue(websocket)
+    subscribe(websocket, everything=True)
+    resuming, since = resume_point(websocket)
+    missed = missed_updates(since) if since is not None else None
+    if missed is not None:
+        # Replay through the client's queue, ahead of any live update
+        for _, device_id, payload in missed:
+            client_queues[websocket].put(device_id, payload)
     
     try:
-        # Send current status immediately
-        await websocket.send(json.dumps(latest_neopixel_status))
-        print(f"✅ Sent initial status to {websocket.remote_address}")
+        if missed is not None:
+            ws_log.debug("⏩ Resumed %s from seq %d, replaying %d updates", websocket.remote_address, since, len(missed))
+        elif resuming:
+            await websocket.send(snapshot_frame(), text=True)
+            if since is None:
+                ws_log.debug("🗂️ Sent snapshot to %s, resuming from another epoch", websocket.remote_address)
+            else:
+                ws_log.debug("🗂️ Sent snapshot to %s, seq %d is no longer buffered", websocket.remote_address, since)
+        else:
+            # Send current status immediately
+            current = latest_record.encode() if latest_record is not None else json_bytes(NO_STATUS)
+            await websocket.send(with_fields(current, seq=update_seq, epoch=server_epoch), text=True)
+            ws_log.debug("✅ Sent initial status to %s", websocket.remote_address)
         
         # Keep connection alive with proper message handling
         async for message in websocket:
             try:
                 # Handle ping/pong for connection health
-                if message == "ping":
+                if not isinstance(message, str):
+                    await websocket.send(json.dumps({"type": "error", "error": "binary frames are not supported"}))
+                elif message == "ping":
                     await websocket.send("pong")
-                    print(f"🏓 Ping-pong with {websocket.remote_address}")
+                    ws_log.debug("🏓 Ping-pong with %s", websocket.remote_address)
+                elif message.startswith('{'):
+                    await handle_subscription_message(websocket, json.loads(message))
                 else:
                     # Handle any other messages from client
-                    print(f"📨 Received message from {websocket.remote_address}: {message}")
+                    ws_log.debug("📨 Received message from %s: %s", websocket.remote_address, message)
+            except json.JSONDecodeError:
+                await websocket.send(json.dumps({"type": "error", "error": "invalid JSON"}))
             except Exception as e:
-                print(f"⚠️ Error handling message from {websocket.remote_address}: {e}")
+                ws_log.warning("⚠️ Error handling message from %s: %s", websocket.remote_address, e)
                 break
                 
     except websockets.exceptions.ConnectionClosed:
-        print(f"🔌 WebSocket connection closed from {websocket.remote_address}")
+        ws_log.info("🔌 WebSocket connection closed from %s", websocket.remote_address)
     except Exception as e:
-        print(f"❌ WebSocket error with {websocket.remote_address}: {e}")
+        ws_log.error("❌ WebSocket error with %s: %s", websocket.remote_address, e)
     finally:
         websocket_clients.discard(websocket)
-        print(f"🔌 Removed WebSocket client {websocket.remote_address}")
-
-async def broadcast_status():
-    """Broadcast status updates to all WebSocket clients"""
-    if websocket_clients:
-        message = json.dumps(latest_neopixel_status)
-        await asyncio.gather(
-            *[client.send(message) for client in websocket_clients],
-            return_exceptions=True
-        )
-
-def update_status_and_broadcast(new_status):
-    """Update status and queue broadcast to all WebSocket clients"""
-    global latest_neopixel_status
-    latest_neopixel_status = new_status
-    
-    # Use thread-safe queue for status updates
-    with status_update_lock:
-        status_update_queue.append(new_status)
-        print(f"📡 Added status update to queue: {new_status.get('status', 'unknown')} (count: {new_status.get('count', 'unknown')})")
-
-class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        """Handle GET requests"""
-        if self.path == '/':
-            # Return a nice HTML page with NeoPixel status
-            html_content = f"""
+        drop_subscriptions(websocket)
+        client_queues.pop(websocket).close()
+        ws_log.debug("🔌 Removed WebSocket client %s", websocket.remote_address)
+
+def update_status_and_broadcast(update, replicate=True):
+    """Apply a StatusUpdate to the sending device's record and queue a broadcast to its subscribers
+    
+    Updates from another worker arrive with replicate=False: they are
+    applied and broadcast here, but were already logged and shared by
+    the worker that received them.
+    """
+    global latest_record
+    device_id = update.device_id
+    record = device_record(device_id)
+    record.update(update)
+    
+    # Liveness uses the server's clock; history uses the board's when it can be trusted
+    received_at = time.time()
+    learn_interval(record, received_at)
+    record.last_seen = received_at
+    devices.move_to_end(device_id)
+    check_liveness(record, received_at)
+    latest_record = record
+    history = device_history[device_id]
+    history.append(history_time(history, update.timestamp, received_at), record.status, record.count)
+    
+    if replicate:
+        if status_log is not None:
+            status_log.append(received_at, device_id, record.group, record.status, record.count,
+                              record.board, record.ip_address, float(record.timestamp))
+        if fanout_bus is not None:
+            fanout_bus.publish(record.encode())  # Cached, so fan-out here reuses these bytes
+    
+    # HTTP and WebSocket share the event loop, so this wakes
+    # broadcast_processor directly without any cross-thread handoff
+    schedule_broadcast(device_id, record)
+    ingest_log.debug("📡 Added status update to queue: %s %s (count: %s)", device_id, record.status, record.count)
+
+def apply_peer_update(data):
+    """Status update forwarded by another worker over the fan-out bus"""
+    try:
+        update = parse_status_update(json_loads(data))
+    except ValueError as e:
+        fanout_log.warning("⚠️ Ignored bad update from another worker: %s", e)
+        return
+    INGEST_UPDATES.labels('bus').inc()
+    update_status_and_broadcast(update, replicate=False)
+
+class DatagramStats:
+    """Sequence tracking for one device's UDP datagrams"""
+    __slots__ = ('highest', 'window', 'received', 'lost', 'reordered', 'duplicates', 'restarts')
+    
+    def __init__(self):
+        self.highest = None  # Newest sequence number seen
+        self.window = 0  # Bit i set = highest - i has arrived
+        self.received = 0
+        self.lost = 0  # Gaps not (yet) filled by a late datagram
+        self.reordered = 0
+        self.duplicates = 0
+        self.restarts = 0
+    
+    def accept(self, sequence):
+        """Record a sequence number; True if it is new and in order
+        
+        A board starts again from 0 after a reset, which restarts tracking.
+        """
+        self.received += 1
+        if self.highest is None or sequence == 0 or self.highest - sequence > UDP_RESTART_GAP:
+            if self.highest is not None:
+                self.restarts += 1
+            self.highest = sequence
+            self.window = 1
+            return True
+        
+        if sequence > self.highest:
+            gap = sequence - self.highest
+            self.lost += gap - 1
+            self.window = ((self.window << gap) | 1) & ((1 << UDP_WINDOW) - 1)
+            self.highest = sequence
+            return True
+        
+        # Older than the newest: either a duplicate or a late arrival.
+        # Anything beyond the window is too old to tell, so it counts as a duplicate
+        behind = self.highest - sequence
+        if behind >= UDP_WINDOW or self.window & (1 << behind):
+            self.duplicates += 1
+        else:
+            self.window |= 1 << behind
+            self.lost -= 1
+            self.reordered += 1
+        return False  # A newer status has already been applied
+    
+    def to_dict(self):
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "restarts": self.restarts
+        }
+
+# Per-device datagram loss/reorder counters
+datagram_stats = OrderedDict()  # device_id -> DatagramStats, least recently heard from first
+
+class StatusDatagramProtocol(asyncio.DatagramProtocol):
+    """Receive status_wire datagrams and apply them like POST /status"""
+    
+    def datagram_received(self, data, addr):
+        try:
+            sequence, records = decode_datagram(data)
+            updates = [parse_status_update(record) for record in records]
+        except (ValueError, UnicodeDecodeError) as e:
+            ingest_log.info("⚠️ Ignored bad datagram from %s: %s", addr[0], e)
+            return
+        
+        device_id = updates[0].device_id
+        stats = datagram_stats.get(device_id)
+        if stats is not None:
+            datagram_stats.move_to_end(device_id)
+        else:
+            if len(datagram_stats) >= MAX_DEVICES:
+                datagram_stats.popitem(last=False)  # The sender heard from least recently
+            stats = datagram_stats[device_id] = DatagramStats()
+        if stats.accept(sequence) and not admit(updates, 'udp'):
+            INGEST_UPDATES.labels('udp').inc(len(updates))
+            for update in updates:
+                update_status_and_broadcast(update)
+
+async def authenticate_device(websocket):
+    """Wait for a board's hello frame; return its device id or None"""
+    try:
+        hello = json.loads(await asyncio.wait_for(websocket.recv(), DEVICE_HELLO_TIMEOUT))
+    except (asyncio.TimeoutError, json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(hello, dict) or hello.get('type') != 'hello' or not hello.get('device_id'):
+        return None
+    if DEVICE_TOKEN is not None and not hmac.compare_digest(str(hello.get('token', '')), DEVICE_TOKEN):
+        return None
+    return str(hello['device_id'])
+
+async def device_uplink_handler(websocket):
+    """Long-lived status uplink from one board
+    
+    The board connects to ws://server:8765/device and sends
+    {"type": "hello", "device_id": "...", "token": "..."} once. After that
+    every frame is a status update: a JSON object (optionally with "seq")
+    or a binary frame of status_wire records. Each frame is answered on
+    the same connection with {"type": "ack", "seq": n, "records": k}.
+    """
+    device_id = await authenticate_device(websocket)
+    if device_id is None:
+        ingest_log.warning("🚫 Device uplink from %s failed authentication", websocket.remote_address)
+        await websocket.close(1008, 'authentication failed')
+        return
+    
+    ingest_log.info("📶 Device uplink open: %s from %s", device_id, websocket.remote_address)
+    await websocket.send(json.dumps({"type": "welcome", "device_id": device_id}))
+    frames = 0
+    try:
+        async for frame in websocket:
+            frames += 1
+            try:
+                if isinstance(frame, bytes):
+                    records = decode_status_records(frame)
+                    seq = frames
+                else:
+                    record = json_loads(frame)
+                    if not isinstance(record, dict):
+                        raise ValueError("status frame must be a JSON object")
+                    records = [record]
+                    seq = record.pop('seq', frames)
+                updates = [parse_status_update(record) for record in records]
+            except (ValueError, UnicodeDecodeError) as e:
+                await websocket.send(json.dumps({"type": "nack", "seq": frames, "error": str(e)}))
+                continue
+            
+            # The authenticated identity wins over whatever the frame claims
+            for update in updates:
+                update.device_id = device_id
+            retry_after = admit(updates, 'uplink')
+            if retry_after:
+                await websocket.send(json.dumps({"type": "nack", "seq": seq, "error": "rate limited",
+                                                 "retry_after": round(retry_after, 3)}))
+                continue
+            INGEST_UPDATES.labels('uplink').inc(len(updates))
+            for update in updates:
+                update_status_and_broadcast(update)
+            await websocket.send(json.dumps({"type": "ack", "seq": seq, "records": len(updates)}))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        ingest_log.info("📴 Device uplink closed: %s after %d frames", device_id, frames)
+
+class HTTPError(Exception):
+    """Raised while parsing a request that cannot be served"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class HTTPRequest:
+    """A parsed HTTP/1.1 request"""
+    def __init__(self, method, target, version, headers, body, peer):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = parse_qs(url.query)
+        self.version = version
+        self.headers = headers  # Lower-cased header names
+        self.body = body  # A RequestBody for STREAMED_ROUTES, otherwise bytes
+        self.peer = peer
+    
+    @property
+    def keep_alive(self):
+        """Whether the connection should stay open after this request"""
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+class HTTPResponse:
+    """An HTTP response ready to be written to a connection"""
+    def __init__(self, status=200, body=b'', content_type='text/plain', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = {'Content-Type': content_type}
+        if headers:
+            self.headers.update(headers)
+    
+    def encode(self, keep_alive):
+        """Serialize status line, headers and body"""
+        lines = [f"HTTP/1.1 {self.status} {HTTPStatus(self.status).phrase}"]
+        for name, value in self.headers.items():
+            lines.append(f"{name}: {value}")
+        if self.status not in (204, 304):  # These must not carry a body length
+            lines.append(f"Content-Length: {len(self.body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+        return head.encode('latin-1') + self.body
+
+class RequestBody:
+    """Body of a streamed request, read by its handler a piece at a time
+    
+    Handles Content-Length and chunked bodies alike. Reading past limit
+    raises HTTPError(413), and a sender that stalls for HTTP_BODY_TIMEOUT
+    raises HTTPError(408). A body that wasn't read to the end leaves the
+    connection unusable, so it is closed after the response.
+    """
+    def __init__(self, reader, headers, limit):
+        self.reader = reader
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        try:
+            self.remaining = 0 if self.chunked else int(headers.get('content-length', 0))
+        except ValueError as e:
+            raise HTTPError(400, 'Invalid Content-Length') from e
+        self.limit = limit
+        self.read = 0
+        self.done = not self.chunked and self.remaining == 0
+        self.captured = [] if traffic_capture is not None else None  # Kept only while recording traffic
+        if self.remaining > limit:
+            raise HTTPError(413, 'Request body too large')
+    
+    async def chunks(self):
+        """Yield the body in pieces of at most HTTP_READ_SIZE bytes"""
+        while not self.done:
+            if self.chunked and not self.remaining:
+                size_line = await self.receive(self.reader.readuntil(b'\r\n'))
+                try:
+                    self.remaining = int(size_line.split(b';', 1)[0], 16)
+                except ValueError as e:
+                    raise HTTPError(400, 'Invalid chunk size') from e
+                if self.remaining == 0:
+                    while await self.receive(self.reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass  # Trailers
+                    self.done = True
+                    return
+            piece = await self.receive(self.reader.readexactly(min(self.remaining, HTTP_READ_SIZE)))
+            self.remaining -= len(piece)
+            self.read += len(piece)
+            if self.read > self.limit:
+                raise HTTPError(413, 'Request body too large')
+            if self.chunked and not self.remaining:
+                await self.receive(self.reader.readexactly(2))  # CRLF after each chunk
+            elif not self.chunked:
+                self.done = not self.remaining
+            if self.captured is not None:
+                self.captured.append(piece)
+            yield piece
+    
+    async def receive(self, read):
+        """Await one read, giving up if the sender has gone quiet"""
+        try:
+            return await asyncio.wait_for(read, HTTP_BODY_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            raise HTTPError(408, 'Request body timed out') from e
+
+# Routes whose handler reads the body itself, so it is never buffered whole
+STREAMED_ROUTES = {('POST', '/data'): DATA_MAX_BODY}  # (method, path) -> body size limit
+
+def json_response(data, status=200):
+    """Build a JSON response the way every endpoint formats it"""
+    return HTTPResponse(status, json.dumps(data, indent=2).encode(), 'application/json',
+                        {'Access-Control-Allow-Origin': '*'})
+
+def text_response(status, text):
+    """Build a plain-text error response"""
+    return HTTPResponse(status, text.encode())
+
+def rate_limited_response(retry_after):
+    """429 telling the board how many seconds to back off"""
+    return HTTPResponse(429, b'429 - Too Many Requests',
+                        headers={'Retry-After': str(math.ceil(retry_after))})
+
+# Static dashboard shell; live values come from /snapshot and the WebSocket
+DASHBOARD_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -103,106 +1306,110 @@ class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Metro M4 Airlift Lite - NeoPixel Status</title>
     <style>
-        body {{
+        body {
             font-family: Arial, sans-serif;
             max-width: 800px;
             margin: 0 auto;
             padding: 20px;
             background-color: #f5f5f5;
-        }}
-        .container {{
+        }
+        .container {
             background: white;
             padding: 30px;
             border-radius: 10px;
             box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
-        h1 {{
+        }
+        h1 {
             color: #333;
             text-align: center;
             margin-bottom: 30px;
-        }}
-        .status-card {{
+        }
+        .status-card {
             background: #f8f9fa;
             border: 2px solid #dee2e6;
             border-radius: 8px;
             padding: 20px;
             margin: 20px 0;
             text-align: center;
-        }}
-        .status-on {{
+        }
+        .status-on {
             border-color: #28a745;
             background: #d4edda;
-        }}
-        .status-off {{
+        }
+        .status-off {
             border-color: #6c757d;
             background: #e9ecef;
-        }}
-        .status-indicator {{
+        }
+        .status-indicator {
             font-size: 48px;
             font-weight: bold;
             margin: 10px 0;
-        }}
-        .status-on .status-indicator {{
+        }
+        .status-on .status-indicator {
             color: #28a745;
-        }}
-        .status-off .status-indicator {{
+        }
+        .status-off .status-indicator {
             color: #6c757d;
-        }}
-        .info-grid {{
+        }
+        .info-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
             gap: 15px;
             margin-top: 20px;
-        }}
-        .info-item {{
+        }
+        .info-item {
             background: #f8f9fa;
             padding: 15px;
             border-radius: 5px;
             border-left: 4px solid #007bff;
-        }}
-        .info-label {{
+        }
+        .info-label {
             font-weight: bold;
             color: #495057;
             margin-bottom: 5px;
-        }}
-        .info-value {{
+        }
+        .info-value {
             color: #212529;
-        }}
-        .refresh-info {{
+        }
+        .refresh-info {
             text-align: center;
             color: #6c757d;
             font-size: 14px;
             margin-top: 20px;
-        }}
+        }
     </style>
 </head>
 <body>
             <div class="container">
             <h1>🚀 Metro M4 Airlift Lite - Real-time Status</h1>
             
-            <div class="status-card {'status-on' if latest_neopixel_status['status'] == 'ON' else 'status-off'}">
+            <div class="status-card status-off">
                 <div class="status-indicator">
-                    {'💡 ON' if latest_neopixel_status['status'] == 'ON' else '⚫ OFF'}
+                    ⚫ OFF
                 </div>
-                <h2>NeoPixel Status: {latest_neopixel_status['status']}</h2>
+                <h2>NeoPixel Status: Unknown</h2>
             </div>
             
             <div class="info-grid">
                 <div class="info-item">
                     <div class="info-label">Blink Count</div>
-                    <div class="info-value" id="blink-count">{latest_neopixel_status['count']}</div>
+                    <div class="info-value" id="blink-count">0</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Board</div>
-                    <div class="info-value" id="board-name">{latest_neopixel_status['board']}</div>
+                    <div class="info-value" id="board-name">Metro M4 Airlift Lite</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">IP Address</div>
-                    <div class="info-value" id="ip-address">{latest_neopixel_status['ip_address']}</div>
+                    <div class="info-value" id="ip-address">Unknown</div>
+                </div>
+                <div class="info-item">
+                    <div class="info-label">Liveness</div>
+                    <div class="info-value" id="liveness">Unknown</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Last Update</div>
-                    <div class="info-value" id="last-update">{datetime.fromtimestamp(latest_neopixel_status['timestamp']).strftime('%H:%M:%S') if latest_neopixel_status['timestamp'] > 0 else 'Never'}</div>
+                    <div class="info-value" id="last-update">Never</div>
                 </div>
             </div>
             
@@ -218,64 +1425,86 @@ class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             let ws = null;
             let reconnectAttempts = 0;
             const maxReconnectAttempts = 5;
+            let epoch = null;   // Server run the sequence numbers below belong to
+            let lastSeq = null; // Last update seen, so a reconnect only replays what was missed
             
-            function connectWebSocket() {{
-                ws = new WebSocket('ws://192.168.1.192:8765');
+            function connectWebSocket() {
+                let url = 'ws://' + location.hostname + ':__WS_PORT__/';
+                if (epoch !== null && lastSeq !== null) {
+                    url += '?epoch=' + epoch + '&since=' + lastSeq;
+                }
+                ws = new WebSocket(url);
                 
-                ws.onopen = function() {{
+                ws.onopen = function() {
                     console.log('WebSocket connected');
                     document.getElementById('connection-status').textContent = '🟢 Connected';
                     reconnectAttempts = 0; // Reset reconnect attempts on successful connection
                     
                     // Start ping interval to keep connection alive
-                    if (ws.pingInterval) {{
+                    if (ws.pingInterval) {
                         clearInterval(ws.pingInterval);
-                    }}
-                    ws.pingInterval = setInterval(function() {{
-                        if (ws.readyState === WebSocket.OPEN) {{
+                    }
+                    ws.pingInterval = setInterval(function() {
+                        if (ws.readyState === WebSocket.OPEN) {
                             ws.send('ping');
-                        }}
-                    }}, 30000); // Ping every 30 seconds
-                }};
+                        }
+                    }, 30000); // Ping every 30 seconds
+                };
                 
-                ws.onmessage = function(event) {{
+                ws.onmessage = function(event) {
                     console.log('Received WebSocket message:', event.data);
-                    try {{
+                    if (event.data === 'pong') {
+                        return;
+                    }
+                    try {
                         const data = JSON.parse(event.data);
-                        updateDisplay(data);
-                    }} catch (error) {{
+                        if (data.epoch !== undefined) {
+                            epoch = data.epoch;
+                        }
+                        if (data.seq !== undefined) {
+                            lastSeq = data.seq;
+                        }
+                        if (data.type === 'snapshot') {
+                            // Too much was missed to replay; boards come oldest first
+                            if (data.devices.length > 0) {
+                                updateDisplay(data.devices[data.devices.length - 1]);
+                            }
+                        } else if (data.type === undefined) {
+                            updateDisplay(data);
+                        }
+                    } catch (error) {
                         console.error('Error parsing WebSocket message:', error);
-                    }}
-                }};
+                    }
+                };
                 
-                ws.onclose = function() {{
+                ws.onclose = function() {
                     console.log('WebSocket disconnected');
                     document.getElementById('connection-status').textContent = '🟡 Reconnecting...';
                     
                     // Clear ping interval
-                    if (ws.pingInterval) {{
+                    if (ws.pingInterval) {
                         clearInterval(ws.pingInterval);
                         ws.pingInterval = null;
-                    }}
+                    }
                     
                     // Try to reconnect instead of reloading the page
-                    if (reconnectAttempts < maxReconnectAttempts) {{
+                    if (reconnectAttempts < maxReconnectAttempts) {
                         reconnectAttempts++;
                         console.log('Reconnect attempt ' + reconnectAttempts + '/' + maxReconnectAttempts);
                         setTimeout(connectWebSocket, 2000);
-                    }} else {{
+                    } else {
                         document.getElementById('connection-status').textContent = '🔴 Connection failed';
                         console.log('Max reconnect attempts reached');
-                    }}
-                }};
+                    }
+                };
                 
-                ws.onerror = function(error) {{
+                ws.onerror = function(error) {
                     console.error('WebSocket error:', error);
                     document.getElementById('connection-status').textContent = '🔴 Error';
-                }};
-            }}
+                };
+            }
             
-            function updateDisplay(data) {{
+            function updateDisplay(data) {
                 console.log('Updating display with data:', data);
                 
                 // Update status card
@@ -283,139 +1512,482 @@ class SimpleHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 const statusIndicator = document.querySelector('.status-indicator');
                 const statusText = document.querySelector('h2');
                 
-                if (data.status === 'ON') {{
+                if (data.status === 'ON') {
                     statusCard.className = 'status-card status-on';
                     statusIndicator.textContent = '💡 ON';
                     statusText.textContent = 'NeoPixel Status: ON';
-                }} else {{
+                } else {
                     statusCard.className = 'status-card status-off';
                     statusIndicator.textContent = '⚫ OFF';
                     statusText.textContent = 'NeoPixel Status: OFF';
-                }}
+                }
                 
                 // Update info grid
                 document.getElementById('blink-count').textContent = data.count;
                 document.getElementById('board-name').textContent = data.board;
                 document.getElementById('ip-address').textContent = data.ip_address;
+                const liveness = {online: '🟢 Online', stale: '🟠 Stale', offline: '🔴 Offline'};
+                document.getElementById('liveness').textContent = liveness[data.liveness] || 'Unknown';
                 
-                const timestamp = new Date(data.timestamp * 1000);
-                document.getElementById('last-update').textContent = timestamp.toLocaleTimeString();
+                if (data.timestamp > 0) {
+                    const timestamp = new Date(data.timestamp * 1000);
+                    document.getElementById('last-update').textContent = timestamp.toLocaleTimeString();
+                }
                 
                 console.log('Display updated successfully');
-            }}
+            }
+            
+            // Show the latest values right away, then follow the WebSocket
+            fetch('/snapshot')
+                .then(function(response) { return response.json(); })
+                .then(updateDisplay)
+                .catch(function(error) { console.error('Error loading snapshot:', error); });
             
             // Start the WebSocket connection
             connectWebSocket();
         </script>
 </body>
 </html>
-            """
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            self.wfile.write(html_content.encode())
-            
-        elif self.path == '/status':
-            # Return server status
-            response = {
-                "server": "Mac Simple HTTP Server",
-                "uptime": "running",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+"""
+
+def render_dashboard_page():
+    """Render the dashboard shell for this server's WebSocket port"""
+    return DASHBOARD_TEMPLATE.replace('__WS_PORT__', str(WS_PORT))
+
+def preferred_encoding(accept_encoding, available):
+    """Best of br, gzip and identity that an Accept-Encoding header allows"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        try:
+            if params and float(params.strip().split('=', 1)[1]) == 0:
+                continue  # q=0 means "not this one"
+        except (IndexError, ValueError):
+            pass
+        accepted.add(name.strip().lower())
+    for encoding in ('br', 'gzip'):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return 'identity'
+
+class StaticAsset:
+    """A body built once and precompressed, served with strong ETags
+    
+    Each encoding is a separate representation and so gets its own ETag;
+    If-None-Match matching any of them means the client's copy is current.
+    """
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {'identity': (body, f'"{digest}"'),
+                         'gzip': (gzip.compress(body, 9, mtime=0), f'"{digest}-gz"')}
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+    
+    def response(self, request):
+        """304 if the client's copy is current, else the best encoding it accepts"""
+        encoding = preferred_encoding(request.headers.get('accept-encoding', ''), self.variants)
+        body, etag = self.variants[encoding]
+        headers = {'ETag': etag, 'Cache-Control': f'public, max-age={DASHBOARD_MAX_AGE}',
+                   'Vary': 'Accept-Encoding', 'Access-Control-Allow-Origin': '*'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or tags & self.etags:
+                return HTTPResponse(304, content_type=self.content_type, headers=headers)
+        return HTTPResponse(200, body, self.content_type, headers)
+
+# Built in main() once the WebSocket port is known
+dashboard_asset = None
+
+async def handle_dashboard(request):
+    """GET / - real-time web interface (static shell, cached by the browser)"""
+    return dashboard_asset.response(request)
+
+async def handle_snapshot(request):
+    """GET /snapshot?device=ID - latest status the dashboard starts from"""
+    device_id = request.query.get('device', [None])[0]
+    if device_id is None:
+        snapshot = latest_record.encode() if latest_record is not None else json_bytes(NO_STATUS)
+    elif device_id in devices:
+        snapshot = devices[device_id].encode()
+    else:
+        return text_response(404, '404 - Unknown device')
+    return HTTPResponse(200, snapshot, 'application/json',
+                        {'Access-Control-Allow-Origin': '*', 'Cache-Control': 'no-store'})
+
+async def handle_server_status(request):
+    """GET /status - server status"""
+    response = {
+        "server": "Mac Simple HTTP Server",
+        "uptime": "running",
+        "timestamp": datetime.now().isoformat()
+    }
+    return json_response(response)
+
+async def handle_devices(request):
+    """GET /devices - latest status of every known board"""
+    entries = []
+    for record in devices.values():
+        entry = record.to_dict()
+        stats = datagram_stats.get(record.device_id)
+        if stats is not None:
+            entry["udp"] = stats.to_dict()
+        entries.append(entry)
+    return json_response({
+        "devices": entries,
+        "timestamp": datetime.now().isoformat()
+    })
+
+async def handle_history(request):
+    """GET /history?device=...&from=...&to=...&max_points=... - downsampled history"""
+    device_id = request.query.get('device', [None])[0]
+    if device_id is None:
+        return text_response(400, '400 - Missing device parameter')
+    history = device_history.get(device_id)
+    if history is None:
+        return text_response(404, '404 - Unknown device')
+    
+    try:
+        start_time = float(request.query.get('from', [0])[0])
+        end_time = float(request.query.get('to', [time.time()])[0])
+        max_points = int(request.query.get('max_points', [HISTORY_MAX_POINTS])[0])
+    except ValueError:
+        return text_response(400, '400 - Invalid query parameter')
+    if start_time > end_time:
+        return text_response(400, '400 - from is after to')
+    max_points = max(1, min(max_points, HISTORY_MAX_POINTS))
+    
+    total, timestamps, statuses, counts = history.query(start_time, end_time, max_points)
+    response = {
+        "device_id": device_id,
+        "from": start_time,
+        "to": end_time,
+        "total_points": total,
+        "returned_points": len(timestamps),
+        "timestamps": timestamps,
+        "status": statuses,
+        "count": counts
+    }
+    # Columnar arrays stay compact; no indentation here
+    return HTTPResponse(200, json.dumps(response, separators=(',', ':')).encode(), 'application/json',
+                        {'Access-Control-Allow-Origin': '*'})
+
+def collect_runtime_metrics():
+    """Gauges read at scrape time instead of being tracked per update"""
+    now = time.time()
+    connected = [queue for queue in client_queues.values() if not queue.closed]
+    lines = metrics.gauge_lines('m4_broadcast_queue_depth', 'Updates waiting for fan-out',
+                                [((), len(pending_broadcasts))])
+    lines += metrics.gauge_lines('m4_client_queue_messages', 'Messages waiting in client queues',
+                                 [((), sum(len(q.pending) + len(q.latest) for q in connected))])
+    lines += metrics.gauge_lines('m4_websocket_clients', 'Connected WebSocket viewers',
+                                 [((), len(websocket_clients))])
+    lines += metrics.gauge_lines('m4_event_stream_clients', 'Connected GET /events viewers',
+                                 [((), sum(1 for q in connected if q.event_stream))])
+    lines += metrics.gauge_lines('m4_client_conflated_messages_max', 'Most updates conflated for one connected viewer',
+                                 [((), max((q.conflated for q in connected), default=0))])
+    liveness_counts = {'online': 0, 'stale': 0, 'offline': 0}
+    for record in devices.values():
+        liveness_counts[record.liveness] += 1
+    lines += metrics.gauge_lines('m4_devices', 'Known boards by liveness',
+                                 [((liveness,), count) for liveness, count in liveness_counts.items()], ('liveness',))
+    lines += metrics.gauge_lines('m4_device_last_seen_age_seconds', 'Seconds since each board last reported',
+                                 [((record.device_id,), round(now - record.last_seen, 3))
+                                  for record in devices.values()], ('device',))
+    return lines
+
+metrics.REGISTRY.add_collector(collect_runtime_metrics)
+
+async def handle_events(request):
+    """GET /events?device=ID&group=G - Server-Sent Events stream of status updates
+    
+    Without filters every board is streamed. A reconnecting EventSource
+    sends Last-Event-ID by itself; other clients can pass ?last_event_id=.
+    """
+    last_event_id = request.headers.get('last-event-id') or request.query.get('last_event_id', [None])[0]
+    return EventStream(set(request.query.get('device', [])), set(request.query.get('group', [])), last_event_id)
+
+async def handle_metrics(request):
+    """GET /metrics - Prometheus text format"""
+    return HTTPResponse(200, metrics.REGISTRY.render().encode(), metrics.PROMETHEUS_CONTENT_TYPE)
+
+async def handle_data(request):
+    """POST /data - bulk upload from Metro M4, e.g. a buffered sensor dump
+    
+    The body is NDJSON, or status_wire records when Content-Type is
+    application/x-m4-status, and may be chunked. Records are stored as
+    they arrive; the reply summarizes the upload instead of echoing it.
+    File access runs in the default executor, like the status log's, so
+    a slow disk doesn't hold up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    binary = is_binary_status(request)
+    parser = UploadParser(binary, json_loads)
+    upload = await loop.run_in_executor(None, upload_store.open, request.peer[0], binary) if upload_store is not None else None
+    try:
+        async for chunk in request.body.chunks():
+            records = parser.feed(chunk)
+            if upload is not None and records:
+                await loop.run_in_executor(None, upload.write, records)
+        records = parser.finish()
+        if upload is not None:
+            await loop.run_in_executor(None, upload.write, records)
+    except (HTTPError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        if upload is not None:
+            await loop.run_in_executor(None, upload.abort)
+        status = e.status if isinstance(e, HTTPError) else 400  # Bad record, or the body was cut short
+        ingest_log.info("Rejected upload from %s after %d bytes: %s", request.peer[0], parser.bytes, e)
+        return text_response(status, f'{status} - {e}')
+    except BaseException:
+        if upload is not None:
+            upload.abort()  # Sender went away mid-upload; inline, as the task is being torn down
+        raise
+    if upload is not None:
+        await loop.run_in_executor(None, upload.commit)
+    
+    DATA_BYTES.inc(parser.bytes)
+    DATA_RECORDS.labels('accepted').inc(parser.records)
+    DATA_RECORDS.labels('rejected').inc(parser.rejected)
+    ingest_log.debug("Stored upload from %s: %d records, %d bytes", request.peer[0], parser.records, parser.bytes)
+    response = {
+        "message": "Data received",
+        "records": parser.records,
+        "rejected": parser.rejected,
+        "bytes": parser.bytes,
+        "crc32": "%08x" % parser.crc32,
+        "timestamp": datetime.now().isoformat()
+    }
+    return json_response(response)
+
+def is_binary_status(request):
+    """Whether the body uses the compact status_wire record format"""
+    return request.headers.get('content-type', '').split(';')[0].strip() == STATUS_CONTENT_TYPE
+
+def handle_binary_status(request):
+    """Apply back-to-back binary status records; 204 keeps the reply tiny"""
+    try:
+        updates = [parse_status_update(record) for record in decode_status_records(request.body)]
+    except (ValueError, UnicodeDecodeError) as e:
+        ingest_log.info("Rejected binary status: %s", e)
+        return text_response(400, '400 - Bad Request')
+    retry_after = admit(updates, request.path)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    INGEST_UPDATES.labels(request.path).inc(len(updates))
+    for update in updates:
+        update_status_and_broadcast(update)
+    return HTTPResponse(204, headers={'Access-Control-Allow-Origin': '*'})
+
+async def handle_status_update(request):
+    """POST /status - NeoPixel status update from Metro M4
+    
+    Accepts JSON, or one status_wire record when Content-Type is
+    application/x-m4-status.
+    """
+    if is_binary_status(request):
+        return handle_binary_status(request)
+    
+    try:
+        data = json_loads(request.body)
+        update = parse_status_update(data)
+    except ValueError as e:
+        ingest_log.info("Rejected status from %s: %s", request.peer[0], e)
+        return text_response(400, f'400 - Bad Request: {e}')
+    
+    ingest_log.debug("NeoPixel Status: %s", data)
+    retry_after = admit([update], request.path)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    # Update status and broadcast to all WebSocket clients
+    INGEST_UPDATES.labels(request.path).inc()
+    update_status_and_broadcast(update)
+    
+    response = {
+        "message": "Status received",
+        "status": data,
+        "timestamp": datetime.now().isoformat()
+    }
+    return json_response(response)
+
+def parse_status_batch(request):
+    """Decode and validate a batch body: a JSON array, or NDJSON with one record per line"""
+    body = request.body.strip()
+    if body.startswith(b'['):
+        records = json_loads(body)
+    else:
+        records = [json_loads(line) for line in body.splitlines() if line.strip()]
+    return [parse_status_update(record) for record in records]
+
+async def handle_status_batch(request):
+    """POST /status/batch - several status updates from Metro M4 in one request"""
+    if is_binary_status(request):
+        return handle_binary_status(request)
+    
+    try:
+        updates = parse_status_batch(request)
+    except ValueError as e:
+        ingest_log.info("Rejected status batch: %s", e)
+        return text_response(400, f'400 - Bad Request: {e}')
+    
+    ingest_log.debug("NeoPixel Status batch: %d records", len(updates))
+    retry_after = admit(updates, request.path)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    # Same path as POST /status, applied in the order the board sent them
+    INGEST_UPDATES.labels(request.path).inc(len(updates))
+    for update in updates:
+        update_status_and_broadcast(update)
+    
+    response = {
+        "message": "Status batch received",
+        "accepted": len(updates),
+        "timestamp": datetime.now().isoformat()
+    }
+    return json_response(response)
+
+# (method, path) -> async handler returning an HTTPResponse
+HTTP_ROUTES = {
+    ('GET', '/'): handle_dashboard,
+    ('GET', '/status'): handle_server_status,
+    ('GET', '/devices'): handle_devices,
+    ('GET', '/snapshot'): handle_snapshot,
+    ('GET', '/events'): handle_events,
+    ('GET', '/history'): handle_history,
+    ('GET', '/metrics'): handle_metrics,
+    ('POST', '/data'): handle_data,
+    ('POST', '/status'): handle_status_update,
+    ('POST', '/status/batch'): handle_status_batch,
+}
+
+async def read_http_request(reader, peer):
+    """Read one request from a connection, or return None on a clean close"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HTTPError(400, 'Incomplete request') from e
+        return None
+    except asyncio.LimitOverrunError as e:
+        raise HTTPError(431, 'Request header too large') from e
+    
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError as e:
+        raise HTTPError(400, 'Malformed request line') from e
+    
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    
+    limit = STREAMED_ROUTES.get((method, urlsplit(target).path))
+    if limit is not None:
+        body = RequestBody(reader, headers, limit)
+    elif 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = await read_chunked_body(reader)
+    else:
+        try:
+            content_length = int(headers.get('content-length', 0))
+        except ValueError as e:
+            raise HTTPError(400, 'Invalid Content-Length') from e
+        if content_length > HTTP_MAX_BODY:
+            raise HTTPError(413, 'Request body too large')
+        body = await reader.readexactly(content_length) if content_length else b''
+    
+    return HTTPRequest(method, target, version, headers, body, peer)
+
+async def read_chunked_body(reader):
+    """Read a Transfer-Encoding: chunked body"""
+    chunks = []
+    total = 0
+    while True:
+        size_line = await reader.readuntil(b'\r\n')
+        try:
+            size = int(size_line.split(b';', 1)[0], 16)
+        except ValueError as e:
+            raise HTTPError(400, 'Invalid chunk size') from e
+        if size == 0:
+            # Skip any trailers up to the final blank line
+            while await reader.readuntil(b'\r\n') != b'\r\n':
+                pass
+            return b''.join(chunks)
+        total += size
+        if total > HTTP_MAX_BODY:
+            raise HTTPError(413, 'Request body too large')
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)  # CRLF after each chunk
+
+async def handle_http_connection(reader, writer):
+    """Serve requests on one persistent HTTP/1.1 connection"""
+    peer = writer.get_extra_info('peername')
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_http_request(reader, peer), HTTP_IDLE_TIMEOUT)
+            except HTTPError as e:
+                writer.write(text_response(e.status, f"{e.status} - {e}").encode(keep_alive=False))
+                await writer.drain()
+                break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            if request is None:
+                break
+            arrival = time.time()
+            streamed = isinstance(request.body, RequestBody)
+            if traffic_capture is not None and request.method == 'POST' and request.path in CAPTURE_PATHS and not streamed:
+                traffic_capture.write(arrival, request.path, is_binary_status(request), peer[0], request.body)
             
-            self.wfile.write(json.dumps(response, indent=2).encode())
+            handler = HTTP_ROUTES.get((request.method, request.path))
+            started = time.perf_counter()
+            if handler is None:
+                response = text_response(404, '404 - Not Found')
+            else:
+                try:
+                    response = await handler(request)
+                except Exception as e:
+                    http_log.error("❌ Error handling %s %s: %s", request.method, request.path, e)
+                    response = text_response(500, '500 - Internal Server Error')
             
-        else:
-            # Return 404 for unknown paths
-            self.send_response(404)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'404 - Not Found')
-
-    def do_POST(self):
-        """Handle POST requests"""
-        if self.path == '/data':
-            # Get the content length
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            # Unknown paths share one label so scanners can't blow up the series count
+            route = request.path if handler is not None else 'other'
+            if request.method == 'POST':
+                POST_LATENCY.labels(route).observe(time.perf_counter() - started)
             
-            try:
-                # Try to parse as JSON
-                data = json.loads(post_data.decode('utf-8'))
-                print(f"Received data: {data}")
-                
-                response = {
-                    "message": "Data received successfully",
-                    "received_data": data,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                self.wfile.write(json.dumps(response, indent=2).encode())
-                
-            except json.JSONDecodeError:
-                # Handle non-JSON data
-                response = {
-                    "message": "Data received (not JSON)",
-                    "received_data": post_data.decode('utf-8'),
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                self.wfile.write(json.dumps(response, indent=2).encode())
-                
-        elif self.path == '/status':
-            # Handle NeoPixel status updates
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            if isinstance(response, EventStream):
+                # The connection belongs to the stream until the viewer goes away
+                HTTP_REQUESTS.labels(request.method, route, 200).inc()
+                http_log.debug('%s "%s %s %s" 200 (event stream)', peer[0], request.method, request.path, request.version)
+                await response.serve(writer)
+                break
+            HTTP_REQUESTS.labels(request.method, route, response.status).inc()
             
-            try:
-                data = json.loads(post_data.decode('utf-8'))
-                print(f"NeoPixel Status: {data}")
-                
-                # Update status and broadcast to all WebSocket clients
-                update_status_and_broadcast(data)
-                
-                response = {
-                    "message": "Status received",
-                    "status": data,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                self.wfile.write(json.dumps(response, indent=2).encode())
-                
-            except Exception as e:
-                print(f"Error processing status: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'text/plain')
-                self.end_headers()
-                self.wfile.write(b'500 - Internal Server Error')
-        else:
-            self.send_response(404)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'404 - Not Found')
+            keep_alive = request.keep_alive
+            if streamed:
+                if request.body.captured is not None and request.body.done:
+                    traffic_capture.write(arrival, request.path, is_binary_status(request), peer[0],
+                                          b''.join(request.body.captured))
+                keep_alive = keep_alive and request.body.done  # Unread body still on the wire
+            writer.write(response.encode(keep_alive))
+            await writer.drain()
+            http_log.debug('%s "%s %s %s" %d', peer[0], request.method, request.path, request.version, response.status)
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    except asyncio.CancelledError:
+        pass  # Server shutting down with the connection open (e.g. an event stream)
+    finally:
+        writer.close()
+
 
 def get_local_ip():
     """Get the local IP address of this Mac"""
@@ -430,47 +2002,124 @@ def get_local_ip():
         return "127.0.0.1"
 
 async def broadcast_processor():
-    """Background task to process broadcast queue"""
-    print("🔄 Broadcast processor started")
+    """Background task that fans out queued status updates as they arrive"""
+    global update_seq
+    fanout_log.info("🔄 Broadcast processor started")
     while True:
+        # Sleeps until update_status_and_broadcast hands over an update
+        device_id = await broadcast_queue.get()
+        record = pending_broadcasts.pop(device_id, None)
+        if record is None:
+            continue  # The device was forgotten to make room for another
+        last_broadcast[device_id] = time.monotonic()
         try:
-            # Check for new status updates from the thread-safe queue
-            updates_to_process = []
-            with status_update_lock:
-                if status_update_queue:
-                    updates_to_process = status_update_queue.copy()
-                    status_update_queue.clear()
+            fanout_log.debug("📥 Processing broadcast: %s %s (count: %s)", record.device_id, record.status, record.count)
             
-            # Process any updates
-            for new_status in updates_to_process:
-                print(f"📥 Processing broadcast: {new_status.get('status', 'unknown')} (count: {new_status.get('count', 'unknown')})")
-                
-                # Broadcast to all connected WebSocket clients
-                if websocket_clients:
-                    message = json.dumps(new_status)
-                    results = await asyncio.gather(
-                        *[client.send(message) for client in websocket_clients],
-                        return_exceptions=True
-                    )
-                    
-                    # Check for any errors
-                    errors = [r for r in results if isinstance(r, Exception)]
-                    if errors:
-                        print(f"⚠️ Some clients failed to receive broadcast: {errors}")
+            # The record's cached encoding with seq spliced on, kept for resuming
+            # clients and handed as-is to each subscriber's queue; slow clients
+            # never hold up the rest
+            started = time.perf_counter()
+            update_seq += 1
+            payload = record.encode()[:-1] + b',"seq":%d}' % update_seq
+            recent_broadcasts.append((update_seq, device_id, payload))
+            clients = subscribers_for(record.device_id, record.group)
+            if clients:
+                event = None
+                for client in clients:
+                    queue = client_queues[client]
+                    if queue.event_stream:
+                        if event is None:
+                            event = sse_event(update_seq, payload)
+                        queue.put(device_id, event)
                     else:
-                        print(f"✅ Successfully broadcasted to {len(websocket_clients)} clients")
-                else:
-                    print("⚠️ No WebSocket clients connected")
-            
-            # Small delay to prevent busy waiting
-            await asyncio.sleep(0.1)
-            
+                        queue.put(device_id, payload)
+                FANOUT_SECONDS.observe(time.perf_counter() - started)
+                fanout_log.debug("✅ Queued broadcast for %d clients", len(clients))
+            else:
+                fanout_log.debug("⚠️ No WebSocket clients subscribed")
+                
         except Exception as e:
-            print(f"❌ Error in broadcast processor: {e}")
-            await asyncio.sleep(1)
+            fanout_log.error("❌ Error in broadcast processor: %s", e)
 
-async def main():
+def status_log_dirs():
+    """Every log directory to replay: the shared one plus one per worker"""
+    directories = [STATUS_LOG_DIR]
+    for name in sorted(os.listdir(STATUS_LOG_DIR)):
+        path = os.path.join(STATUS_LOG_DIR, name)
+        if name.startswith('worker-') and os.path.isdir(path):
+            directories.append(path)
+    return directories
+
+async def main(worker_index=0, bus_dir=None):
     """Main function to run both HTTP and WebSocket servers"""
+    global status_log, fanout_bus, dashboard_asset, server_epoch, traffic_capture, upload_store
+    loop = asyncio.get_running_loop()
+    server_epoch = os.urandom(4).hex()
+    tasks = []  # Background tasks, cancelled at shutdown
+    dashboard_asset = StaticAsset(render_dashboard_page().encode(), 'text/html; charset=utf-8')
+    if WORKERS > 1:
+        fanout_bus = FanoutBus(bus_dir, worker_index, WORKERS, apply_peer_update)
+        fanout_bus.start(loop)
+    
+    # Restore state from the durable log(s) before accepting updates;
+    # each worker appends to its own directory
+    if STATUS_LOG_DIR:
+        os.makedirs(STATUS_LOG_DIR, exist_ok=True)
+        started = time.perf_counter()
+        replayed = restore_state(status_log_dirs())
+        now = time.time()
+        for record in devices.values():
+            check_liveness(record, now)
+        if worker_index == 0:
+            print(f"📼 Replayed {replayed} logged updates for {len(devices)} devices in {time.perf_counter() - started:.2f}s")
+        log = StatusLog(os.path.join(STATUS_LOG_DIR, f"worker-{worker_index}") if WORKERS > 1 else STATUS_LOG_DIR)
+        log.open()
+        status_log = log
+        tasks.append(asyncio.create_task(log.run()))
+    
+    if TRAFFIC_CAPTURE:
+        path = TRAFFIC_CAPTURE
+        if WORKERS > 1:
+            root, ext = os.path.splitext(path)
+            path = f"{root}-{worker_index}{ext}"
+        traffic_capture = CaptureWriter(path)
+        print(f"🎙️ Recording status traffic to {path}")
+    
+    if DATA_DIR:
+        upload_store = UploadStore(os.path.join(DATA_DIR, f"worker-{worker_index}") if WORKERS > 1 else DATA_DIR)
+    
+    # SO_REUSEPORT lets every worker bind the same ports; the kernel spreads connections
+    reuse_port = WORKERS > 1
+    http_server = await asyncio.start_server(handle_http_connection, HOST, HTTP_PORT, reuse_port=reuse_port)
+    udp_transport, _ = await loop.create_datagram_endpoint(StatusDatagramProtocol, local_addr=(HOST, UDP_PORT),
+                                                           reuse_port=reuse_port)
+    
+    async with http_server, websockets.serve(websocket_handler, HOST, WS_PORT, reuse_port=reuse_port):
+        if worker_index == 0:
+            print_banner()
+        
+        # Start the broadcast processor and liveness watchdog tasks
+        tasks.append(asyncio.create_task(broadcast_processor()))
+        tasks.append(asyncio.create_task(liveness_watchdog()))
+        
+        try:
+            await asyncio.Future()  # Run forever
+        finally:
+            # Stop the tasks before closing what they write to; the status log flushes on close
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            udp_transport.close()
+            if fanout_bus is not None:
+                fanout_bus.close()
+            if status_log is not None:
+                status_log.close()
+            if traffic_capture is not None:
+                traffic_capture.close()
+                print(f"🎙️ Recorded {traffic_capture.records} requests to {traffic_capture.path}")
+
+def print_banner():
+    """Startup summary of ports and endpoints"""
     local_ip = get_local_ip()
     print(f"🚀 Starting Real-time WebSocket Server for Metro M4")
     print(f"📍 Server IP: {local_ip}")
@@ -478,38 +2127,127 @@ async def main():
     print(f"🔌 WebSocket Port: {WS_PORT}")
     print(f"📡 HTTP URL: http://{local_ip}:{HTTP_PORT}")
     print(f"🔌 WebSocket URL: ws://{local_ip}:{WS_PORT}")
+    print(f"📨 UDP status port: {UDP_PORT}")
+    print(f"📶 Device uplink URL: ws://{local_ip}:{WS_PORT}{DEVICE_UPLINK_PATH}")
     print(f"📋 Available endpoints:")
     print(f"   GET  http://{local_ip}:{HTTP_PORT}/          - Real-time web interface")
+    print(f"   GET  http://{local_ip}:{HTTP_PORT}/devices   - Latest status of every board")
+    print(f"   GET  http://{local_ip}:{HTTP_PORT}/snapshot  - Latest status (one board with ?device=ID)")
+    print(f"   GET  http://{local_ip}:{HTTP_PORT}/events    - Server-Sent Events (?device=ID&group=G)")
+    print(f"   GET  http://{local_ip}:{HTTP_PORT}/metrics   - Prometheus metrics")
+    print(f"   GET  http://{local_ip}:{HTTP_PORT}/history?device=ID&from=T&to=T&max_points=N - Downsampled history")
     print(f"   POST http://{local_ip}:{HTTP_PORT}/status    - Receive status from Metro M4")
+    print(f"   POST http://{local_ip}:{HTTP_PORT}/status/batch - Receive batched status (JSON array or NDJSON)")
     print(f"   POST http://{local_ip}:{HTTP_PORT}/data      - Receive data from Metro M4")
     print(f"⏹️  Press Ctrl+C to stop the server")
     print(f"--------------------------------------------------")
     
-    # Start HTTP server in a separate thread
-    def run_http_server():
-        with socketserver.TCPServer((HOST, HTTP_PORT), SimpleHTTPRequestHandler) as httpd:
-            print(f"✅ HTTP Server started on port {HTTP_PORT}")
-            httpd.serve_forever()
-    
-    http_thread = threading.Thread(target=run_http_server, daemon=True)
-    http_thread.start()
-    
-    # Start WebSocket server and broadcast processor
-    print(f"✅ WebSocket Server starting on port {WS_PORT}")
-    async with websockets.serve(websocket_handler, HOST, WS_PORT):
-        print(f"🔌 WebSocket Server ready for real-time connections")
-        print(f"🔗 Metro M4 can connect to: http://{local_ip}:{HTTP_PORT}")
-        
-        # Start the broadcast processor task
-        broadcast_task = asyncio.create_task(broadcast_processor())
-        
-        await asyncio.Future()  # Run forever
+    print(f"✅ HTTP Server started on port {HTTP_PORT}")
+    print(f"✅ UDP status listener started on port {UDP_PORT}")
+    print(f"🔌 WebSocket Server ready for real-time connections on port {WS_PORT}")
+    if WORKERS > 1:
+        print(f"👷 {WORKERS} worker processes sharing these ports")
+    print(f"🔗 Metro M4 can connect to: http://{local_ip}:{HTTP_PORT}")
 
-if __name__ == "__main__":
+def log_sample(value):
+    """--log-sample LOGGER=N -> (LOGGER, N)"""
+    kind, _, every = value.partition('=')
+    if not kind or not every.isdigit() or int(every) < 1:
+        raise argparse.ArgumentTypeError(f"expected LOGGER=N with N >= 1, got {value!r}")
+    return kind, int(every)
+
+def parse_args():
+    """Command-line overrides for the configuration constants"""
+    parser = argparse.ArgumentParser(description="Real-time WebSocket Server for Metro M4 Airlift Lite")
+    parser.add_argument('--host', default=HOST, help="Address to listen on")
+    parser.add_argument('--http-port', type=int, default=HTTP_PORT, help="HTTP port")
+    parser.add_argument('--ws-port', type=int, default=WS_PORT, help="WebSocket port")
+    parser.add_argument('--udp-port', type=int, default=UDP_PORT, help="UDP status port")
+    parser.add_argument('--status-log-dir', default=STATUS_LOG_DIR,
+                        help="Durable status log directory ('' disables it)")
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help="Directory for POST /data uploads ('' only counts them)")
+    parser.add_argument('--data-max-body', type=int, default=DATA_MAX_BODY, metavar='BYTES',
+                        help="Largest POST /data upload accepted")
+    parser.add_argument('--record', default=TRAFFIC_CAPTURE, metavar='PATH',
+                        help="Record POST /status and /data traffic for bench/replay_capture.py (.gz compresses)")
+    parser.add_argument('--log-level', default=LOG_LEVEL,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="Log level")
+    parser.add_argument('--log-sample', type=log_sample, action='append', default=[], metavar='LOGGER=N',
+                        help="Keep 1 in N messages of a logger (websocket, ingest, http, fanout); repeatable")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes sharing the ports (SO_REUSEPORT, Linux only)")
+    parser.add_argument('--device-rate', type=float, default=DEVICE_RATE,
+                        help="Updates per second per board before 429 (0 disables)")
+    parser.add_argument('--global-rate', type=float, default=GLOBAL_RATE,
+                        help="Updates per second across all boards before 429 (0 disables)")
+    parser.add_argument('--max-devices', type=int, default=MAX_DEVICES,
+                        help="Boards tracked at once; beyond this the longest-silent one is forgotten")
+    return parser.parse_args()
+
+def apply_args(args):
+    """Replace the configuration constants with command-line values"""
+    global HOST, HTTP_PORT, WS_PORT, UDP_PORT, STATUS_LOG_DIR, TRAFFIC_CAPTURE, LOG_LEVEL, WORKERS, DEVICE_RATE, GLOBAL_RATE
+    global DATA_DIR, DATA_MAX_BODY, MAX_DEVICES, LOG_SAMPLE_EVERY
+    HOST = args.host
+    HTTP_PORT = args.http_port
+    WS_PORT = args.ws_port
+    UDP_PORT = args.udp_port
+    STATUS_LOG_DIR = args.status_log_dir or None
+    DATA_DIR = args.data_dir or None
+    DATA_MAX_BODY = args.data_max_body
+    STREAMED_ROUTES[('POST', '/data')] = DATA_MAX_BODY
+    TRAFFIC_CAPTURE = args.record
+    LOG_LEVEL = args.log_level
+    LOG_SAMPLE_EVERY = {**LOG_SAMPLE_EVERY, **dict(args.log_sample)}
+    WORKERS = max(1, args.workers)
+    DEVICE_RATE = args.device_rate
+    GLOBAL_RATE = args.global_rate
+    global_bucket.rate = GLOBAL_RATE
+    MAX_DEVICES = max(1, args.max_devices)
+
+def run_server(args, worker_index=0, bus_dir=None):
+    """Run one server process until interrupted"""
+    apply_args(args)
+    sample_every = {get_logger(kind).name: every for kind, every in LOG_SAMPLE_EVERY.items()}
+    log_listener = configure_logging(LOG_LEVEL, rate=LOG_RATE_LIMIT, sample_every=sample_every)
     try:
-        asyncio.run(main())
+        asyncio.run(main(worker_index, bus_dir))
     except KeyboardInterrupt:
-        print("\n🛑 Server stopped by user")
+        if worker_index == 0:
+            print("\n🛑 Server stopped by user")
     except Exception as e:
         print(f"❌ Error starting server: {e}")
+    finally:
+        log_listener.stop()
 
+def run_workers(args):
+    """Start one server process per worker and wait for them"""
+    bus_dir = tempfile.mkdtemp(prefix='m4-bus-')
+    workers = [multiprocessing.Process(target=run_server, args=(args, index, bus_dir), name=f"worker-{index}")
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the workers too; a plain kill -INT only reaches us
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for worker in workers:
+            worker.join()
+    finally:
+        shutil.rmtree(bus_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.workers > 1 and not sys.platform.startswith('linux'):
+        # Elsewhere SO_REUSEPORT lets every worker bind but doesn't share connections out
+        print(f"⚠️ --workers needs Linux's SO_REUSEPORT load balancing; running one worker on {sys.platform}")
+        args.workers = 1
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        run_server(args)
@@ -0,0 +1,131 @@
+# Allocation-free status encoding for the Metro M4
+# Works on CircuitPython and CPython
+#
+# Building a dict, calling esp.pretty_ip() and letting adafruit_requests
+# JSON-encode the body on every blink left enough garbage that the board
+# loop needed a gc.collect() every 10 cycles, and each one stalled the
+# NeoPixel. StatusBuffer renders a record once, with the board name and
+# IP address filled in, into a preallocated buffer that holds a whole
+# batch, one copy of the template per slot. Appending a record overwrites
+# only the status, count and timestamp bytes of the next slot.
+#
+# JSON records are fixed-width NDJSON lines. Numbers are right-aligned
+# and padded with spaces, which JSON allows between tokens, and "ON" and
+# "OFF" are followed by spaces so they are as wide as "Unknown". Binary
+# records are status_wire records. Either way the batch body is just a
+# slice of the buffer: one line for POST /status, several for
+# /status/batch.
+
+COUNT_WIDTH = 10  # Digits in a uint32
+TIMESTAMP_WIDTH = 10  # Whole seconds, like status_wire
+STATUS_WIDTH = 9  # Quoted "Unknown"
+STATUS_FIELDS = {"ON": b'"ON"     ', "OFF": b'"OFF"    ', "Unknown": b'"Unknown"'}  # STATUS_WIDTH each
+STATUS_CODES = {"ON": 2, "OFF": 1, "Unknown": 0}  # status_wire.STATUS_NAMES
+
+def json_template(board, ip_address, device_id=""):
+    """One NDJSON status line with placeholder status, count and timestamp"""
+    identity = '"device_id":"%s",' % device_id if device_id else ""
+    return ('{%s"status":"Unknown","count":%s,"board":"%s","ip_address":"%s","timestamp":%s}\n' % (
+        identity, " " * COUNT_WIDTH, board, ip_address, " " * TIMESTAMP_WIDTH)).encode()
+
+def put_digits(buffer, end, width, value):
+    """Right-align value in buffer[end - width:end], padding with spaces"""
+    start = end - width
+    index = end
+    while True:
+        index -= 1
+        buffer[index] = 48 + value % 10
+        value //= 10
+        if not value or index == start:
+            break
+    while index > start:
+        index -= 1
+        buffer[index] = 32
+
+def put_uint32(buffer, offset, value):
+    """Little-endian uint32, as struct would pack it"""
+    buffer[offset] = value & 0xFF
+    buffer[offset + 1] = (value >> 8) & 0xFF
+    buffer[offset + 2] = (value >> 16) & 0xFF
+    buffer[offset + 3] = (value >> 24) & 0xFF
+
+class StatusBuffer:
+    """Up to capacity status records in one preallocated bytearray
+
+    append() allocates nothing for ON/OFF/Unknown and numbers that fit in
+    a small int; a full buffer drops its oldest record.
+    """
+
+    def __init__(self, capacity, board, ip_address, device_id="", binary=False):
+        self.capacity = capacity
+        self.binary = binary
+        self.board = board
+        self.device_id = device_id
+        self.dropped = 0
+        self.length = 0
+        self.set_ip(ip_address)
+
+    def set_ip(self, ip_address):
+        """Render the template for an address, e.g. after the ESP32 rejoined
+
+        Records already queued keep their status, count and timestamp.
+        """
+        if self.binary:
+            from status_wire import encode_status
+            template = encode_status("Unknown", 0, 0, ip_address, self.device_id)
+            fields = ((1, 1), (4, 4), (8, 4))  # (offset, width) of status code, count, timestamp
+        else:
+            template = json_template(self.board, ip_address, self.device_id)
+            fields = ((template.index(b'"status":') + 9, STATUS_WIDTH),
+                      (template.index(b',"board"') - COUNT_WIDTH, COUNT_WIDTH),
+                      (len(template) - 2 - TIMESTAMP_WIDTH, TIMESTAMP_WIDTH))
+        buffer = bytearray(template * self.capacity)
+        for record in range(self.length):
+            for (old, width), (new, _) in zip(self.fields, fields):
+                old += record * self.size
+                new += record * len(template)
+                buffer[new:new + width] = self.buffer[old:old + width]
+        self.template = template
+        self.fields = fields
+        self.size = len(template)
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, status, count, timestamp):
+        """Add a record; returns True if the oldest one was dropped to make room"""
+        dropped = self.length == self.capacity
+        if dropped:
+            self.consume(1)
+            self.dropped += 1
+        offset = self.length * self.size
+        buffer = self.buffer
+        (status_at, _), (count_at, _), (timestamp_at, _) = self.fields
+        if self.binary:
+            buffer[offset + status_at] = STATUS_CODES.get(status, 0)
+            put_uint32(buffer, offset + count_at, count & 0xFFFFFFFF)
+            put_uint32(buffer, offset + timestamp_at, int(timestamp) & 0xFFFFFFFF)
+        else:
+            field = STATUS_FIELDS.get(status, STATUS_FIELDS["Unknown"])
+            status_at += offset
+            for index in range(STATUS_WIDTH):
+                buffer[status_at + index] = field[index]
+            put_digits(buffer, offset + count_at + COUNT_WIDTH, COUNT_WIDTH, count & 0xFFFFFFFF)
+            put_digits(buffer, offset + timestamp_at + TIMESTAMP_WIDTH, TIMESTAMP_WIDTH, int(timestamp) & 0xFFFFFFFF)
+        self.length += 1
+        return dropped
+
+    def body(self, count):
+        """The first count records as one request body, without copying"""
+        return self.view[:count * self.size]
+
+    def consume(self, count):
+        """Forget the first count records, e.g. once they were sent"""
+        count = min(count, self.length)
+        remaining = (self.length - count) * self.size
+        if remaining:
+            start = count * self.size
+            self.view[:remaining] = self.view[start:start + remaining]
+        self.length -= count
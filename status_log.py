@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Durable append-only status log for simple_server.py
+
+Every accepted status update is appended to an in-memory buffer and
+written to disk by a background task with one fsync per batch, so the
+POST handler never waits on the disk. On startup the server replays the
+log through mmap to rebuild per-device state and recent history.
+
+Directory layout:
+    status-000001.log        segments, appended in order
+    status-000004.compact    last N records per device from every segment <= 4
+"""
+
+import asyncio
+import heapq
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from operator import itemgetter
+
+LOG_SEGMENT_SIZE = 64 * 1024 * 1024  # Rotate to a new segment after this many bytes
+LOG_FSYNC_INTERVAL = 0.5  # Seconds to gather records before a write + fsync
+LOG_MAX_SEGMENTS = 4  # Closed segments allowed before they are compacted
+LOG_KEEP_PER_DEVICE = 4096  # Records per device kept by compaction
+
+# Record: header (payload length, crc32 of payload), then the payload:
+# received_at, board timestamp, count, followed by device_id, group,
+# status, board and ip_address as length-prefixed UTF-8 (max 255 bytes)
+RECORD_HEADER = struct.Struct('<II')
+RECORD_FIXED = struct.Struct('<ddq')
+STRING_FIELDS = 5
+
+def encode_record(received_at, device_id, group, status, count, board, ip_address, timestamp):
+    """Encode one status update as a log record"""
+    parts = [RECORD_FIXED.pack(received_at, timestamp, count)]
+    for text in (device_id, group, status, board, ip_address):
+        data = str(text).encode('utf-8')[:255]
+        parts.append(bytes((len(data),)))
+        parts.append(data)
+    payload = b''.join(parts)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def scan_records(path):
+    """Yield (view, start, end) for the payload of every intact record in a log file
+
+    Stops at the first torn or corrupt record, which is what a crash in
+    the middle of a write leaves behind.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            header_size = RECORD_HEADER.size
+            while offset + header_size <= size:
+                length, crc = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + header_size
+                end = start + length
+                if end > size or zlib.crc32(view[start:end]) != crc:
+                    break
+                yield view, start, end
+                offset = end
+
+def decode_strings(data):
+    """Split the length-prefixed string section of a record"""
+    strings = []
+    position = 0
+    for _ in range(STRING_FIELDS):
+        length = data[position]
+        position += 1
+        strings.append(str(data[position:position + length], 'utf-8', 'replace'))
+        position += length
+    return tuple(strings)
+
+def read_records(path):
+    """Yield decoded records from a log file as
+    (received_at, device_id, group, status, count, board, ip_address, timestamp)
+    """
+    unpack_fixed = RECORD_FIXED.unpack_from
+    fixed_size = RECORD_FIXED.size
+    # A board sends the same strings every time, so decode each distinct
+    # string section once
+    decoded = {}
+    for view, start, end in scan_records(path):
+        received_at, timestamp, count = unpack_fixed(view, start)
+        section = view[start + fixed_size:end]
+        strings = decoded.get(section)
+        if strings is None:
+            if len(decoded) >= 4096:
+                decoded.clear()
+            strings = decoded[section] = decode_strings(section)
+        device_id, group, status, board, ip_address = strings
+        yield received_at, device_id, group, status, count, board, ip_address, timestamp
+
+def parse_name(name):
+    """(number, kind) for a log file name, or None if it is not one of ours"""
+    stem, _, kind = name.partition('.')
+    if not stem.startswith('status-') or kind not in ('log', 'compact'):
+        return None
+    try:
+        return int(stem[len('status-'):]), kind
+    except ValueError:
+        return None
+
+def list_files(directory):
+    """(latest compact number or 0, sorted segment numbers) in a log directory"""
+    compact = 0
+    segments = []
+    for name in os.listdir(directory):
+        parsed = parse_name(name)
+        if parsed is None:
+            continue
+        number, kind = parsed
+        if kind == 'compact':
+            compact = max(compact, number)
+        else:
+            segments.append(number)
+    return compact, sorted(segments)
+
+def replay_directory(directory):
+    """Yield every record stored in a log directory, oldest first
+
+    Read-only, so it is safe on a directory another process is writing.
+    """
+    compact, segments = list_files(directory)
+    paths = [os.path.join(directory, f"status-{compact:06d}.compact")] if compact else []
+    paths += [os.path.join(directory, f"status-{number:06d}.log")
+              for number in segments if number > compact]
+    for path in paths:
+        try:
+            yield from read_records(path)
+        except FileNotFoundError:
+            continue  # Compacted away by its writer while we were reading
+
+class StatusLog:
+    """Segmented append-only log with batched fsync and compaction"""
+
+    def __init__(self, directory, segment_size=LOG_SEGMENT_SIZE, fsync_interval=LOG_FSYNC_INTERVAL,
+                 max_segments=LOG_MAX_SEGMENTS, keep_per_device=LOG_KEEP_PER_DEVICE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.max_segments = max_segments
+        self.keep_per_device = keep_per_device
+        self.buffer = bytearray()
+        self.pending = asyncio.Event()
+        self.file = None
+        self.segment = 0  # Number of the segment being written
+        self.segment_bytes = 0
+        self.lock = threading.Lock()  # Serializes file access between the loop and the executor
+        os.makedirs(directory, exist_ok=True)
+        self._clean_up()
+
+    def _path(self, number, kind):
+        return os.path.join(self.directory, f"status-{number:06d}.{kind}")
+
+    def _files(self):
+        return list_files(self.directory)
+
+    def _clean_up(self):
+        """Remove empty segments and files made redundant by a compaction"""
+        compact, segments = self._files()
+        for name in os.listdir(self.directory):
+            parsed = parse_name(name)
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+            elif parsed is not None and parsed[0] < compact and parsed[1] == 'compact':
+                os.remove(os.path.join(self.directory, name))
+        for number in segments:
+            path = self._path(number, 'log')
+            if number <= compact or (number != self.segment and os.path.getsize(path) == 0):
+                os.remove(path)
+
+    def replay(self):
+        """Yield every stored record, oldest first"""
+        return replay_directory(self.directory)
+
+    def open(self):
+        """Start a fresh segment after the existing ones"""
+        compact, segments = self._files()
+        self.segment = max([compact] + segments) + 1
+        self.file = open(self._path(self.segment, 'log'), 'ab')
+        self.segment_bytes = 0
+
+    def append(self, received_at, device_id, group, status, count, board, ip_address, timestamp):
+        """Buffer one record; the background task makes it durable"""
+        self.buffer += encode_record(received_at, device_id, group, status, count,
+                                     board, ip_address, timestamp)
+        self.pending.set()
+
+    async def run(self):
+        """Write buffered records in batches until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.pending.wait()
+            # Let more records pile up so each fsync covers a batch
+            await asyncio.sleep(self.fsync_interval)
+            self.pending.clear()
+            data, self.buffer = self.buffer, bytearray()
+            await loop.run_in_executor(None, self._write, data)
+            if self.segment_bytes >= self.segment_size:
+                await loop.run_in_executor(None, self._rotate)
+
+    def _write(self, data):
+        with self.lock:
+            self._write_locked(data)
+
+    def _write_locked(self, data):
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.segment_bytes += len(data)
+
+    def _rotate(self):
+        """Close the current segment, start the next and compact if needed"""
+        with self.lock:
+            self.file.close()
+            self.segment += 1
+            self.file = open(self._path(self.segment, 'log'), 'ab')
+            self.segment_bytes = 0
+
+        compact, segments = self._files()
+        closed = [number for number in segments if compact < number < self.segment]
+        if len(closed) >= self.max_segments:
+            self.compact(closed[-1])
+
+    def compact(self, upto):
+        """Fold every segment <= upto into one file with the newest records per device
+
+        The kept records are written back in arrival order, so replay still
+        yields oldest first and logs from several workers merge correctly.
+        """
+        compact, segments = self._files()
+        sources = [self._path(compact, 'compact')] if compact else []
+        sources += [self._path(number, 'log') for number in segments if number <= upto]
+
+        kept = {}  # device_id -> deque of (received_at, raw record)
+        for path in sources:
+            for view, start, end in scan_records(path):
+                received_at = RECORD_FIXED.unpack_from(view, start)[0]
+                length = view[start + RECORD_FIXED.size]
+                device_id = bytes(view[start + RECORD_FIXED.size + 1:start + RECORD_FIXED.size + 1 + length])
+                records = kept.get(device_id)
+                if records is None:
+                    records = kept[device_id] = deque(maxlen=self.keep_per_device)
+                records.append((received_at, bytes(view[start - RECORD_HEADER.size:end])))
+
+        # Write and fsync the new file before it replaces anything
+        target = self._path(upto, 'compact')
+        with open(target + '.tmp', 'wb') as f:
+            f.writelines(record for _, record in heapq.merge(*kept.values(), key=itemgetter(0)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target + '.tmp', target)
+        self._clean_up()
+
+    def close(self):
+        """Flush anything still buffered and close the segment"""
+        with self.lock:
+            if self.file is None:
+                return
+            if self.buffer:
+                self._write_locked(self.buffer)
+                self.buffer = bytearray()
+            self.file.close()
+            self.file = None
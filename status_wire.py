@@ -0,0 +1,79 @@
+# Compact binary status record shared by the Metro M4 and simple_server.py
+# Works on CircuitPython (only needs struct) and CPython
+#
+# Layout (32 bytes, little-endian):
+#   version     B   STATUS_WIRE_VERSION
+#   status      B   0 = Unknown, 1 = OFF, 2 = ON
+#   board       B   index into BOARD_NAMES
+#   reserved    B
+#   count       I   blink count
+#   timestamp   I   board time.time() in whole seconds
+#   ip_address  4s  IPv4 address as returned by esp.ip_address
+#   device_id   16s ASCII, NUL padded (empty = identify by IP address)
+
+import struct
+
+STATUS_CONTENT_TYPE = "application/x-m4-status"
+STATUS_WIRE_VERSION = 1
+STATUS_RECORD = "<BBBBII4s16s"  # CircuitPython's struct has no Struct class
+STATUS_RECORD_SIZE = struct.calcsize(STATUS_RECORD)
+
+STATUS_NAMES = ("Unknown", "OFF", "ON")
+BOARD_NAMES = ("Unknown", "Metro M4 Airlift Lite")
+BOARD_METRO_M4 = 1
+
+def ip_bytes(ip_address):
+    """4-byte form of an IPv4 address given as bytes or dotted string"""
+    if isinstance(ip_address, str):
+        return bytes([int(part) for part in ip_address.split(".")])
+    return bytes(ip_address[:4])
+
+def encode_status(status, count, timestamp, ip_address, device_id="", board=BOARD_METRO_M4):
+    """Pack one status update into a 32-byte record"""
+    code = STATUS_NAMES.index(status) if status in STATUS_NAMES else 0
+    return struct.pack(STATUS_RECORD, STATUS_WIRE_VERSION, code, board, 0, count & 0xFFFFFFFF,
+                       int(timestamp) & 0xFFFFFFFF, ip_bytes(ip_address),
+                       device_id.encode()[:16])
+
+def decode_status(data, offset=0):
+    """Unpack one record into the dict shape that POST /status accepts"""
+    version, code, board, _, count, timestamp, ip, device_id = struct.unpack_from(STATUS_RECORD, data, offset)
+    if version != STATUS_WIRE_VERSION:
+        raise ValueError("unsupported status record version %d" % version)
+    status = {
+        "status": STATUS_NAMES[code] if code < len(STATUS_NAMES) else "Unknown",
+        "count": count,
+        "board": BOARD_NAMES[board] if board < len(BOARD_NAMES) else "Unknown",
+        "ip_address": "%d.%d.%d.%d" % tuple(ip),
+        "timestamp": timestamp,
+    }
+    device_id = device_id.rstrip(b"\0")
+    if device_id:
+        status["device_id"] = device_id.decode()
+    return status
+
+def decode_status_records(data):
+    """Unpack a body holding one or more back-to-back records"""
+    if not data or len(data) % STATUS_RECORD_SIZE:
+        raise ValueError("body is not a whole number of status records")
+    return [decode_status(data, offset) for offset in range(0, len(data), STATUS_RECORD_SIZE)]
+
+# UDP datagram: header followed by one or more status records
+#   magic       2s  DATAGRAM_MAGIC
+#   sequence    I   per-device counter, +1 for every datagram sent
+DATAGRAM_MAGIC = b"M4"
+DATAGRAM_HEADER = "<2sI"
+DATAGRAM_HEADER_SIZE = struct.calcsize(DATAGRAM_HEADER)
+
+def encode_datagram(sequence, records):
+    """Prefix packed status records with the datagram header"""
+    return struct.pack(DATAGRAM_HEADER, DATAGRAM_MAGIC, sequence & 0xFFFFFFFF) + records
+
+def decode_datagram(data):
+    """Return (sequence, status dicts) for a received datagram"""
+    if len(data) < DATAGRAM_HEADER_SIZE:
+        raise ValueError("datagram too short")
+    magic, sequence = struct.unpack_from(DATAGRAM_HEADER, data, 0)
+    if magic != DATAGRAM_MAGIC:
+        raise ValueError("not a status datagram")
+    return sequence, decode_status_records(data[DATAGRAM_HEADER_SIZE:])
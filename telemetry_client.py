@@ -0,0 +1,260 @@
+# Telemetry client for the Metro M4: buffers status records and sends them
+# to simple_server.py, recovering from network trouble without stalling
+# Works on CircuitPython (with adafruit_requests) and CPython
+# (bench/telemetry_bench.py drives it with a fake ESP32)
+#
+# One requests session is reused for every post, so the connection to the
+# server stays open between updates. When sending fails the client climbs
+# a recovery ladder, each rung only after the one before kept failing:
+#   1. retry on the same session
+#   2. reset the socket: drop the session (or UDP socket) and open a new one
+#   3. reset the ESP32 and rejoin WiFi
+# After each failure the ESP32 is asked whether it is still on WiFi. A
+# dropped connection is rejoined at once, and an ESP32 that doesn't answer
+# is reset at once, since retrying can't fix either. A 5xx reply only
+# backs off: the link is fine, so nothing is reset. Any other 4xx except
+# 429 drops the batch, since sending it again would be refused again.
+# Attempts are spaced by jittered exponential backoff. Nothing here sleeps:
+# poll() returns at once while backing off, so the caller keeps its LED
+# timing. Records wait in a bounded offline buffer and drain in batches
+# as soon as the server answers again.
+#
+# The offline buffer is a list of dicts, or a status_buffer.StatusBuffer
+# filled with queue_status(), in which case records are encoded as they
+# are queued and sent straight out of the buffer without allocating.
+
+import random
+import time
+
+try:
+    from status_wire import STATUS_CONTENT_TYPE, encode_datagram, encode_status
+except ImportError:
+    pass  # Only binary and UDP sends need status_wire.py
+
+SEND_ERRORS = (ValueError, RuntimeError, ConnectionError, OSError)  # What a failed send raises on the ESP32
+RETRIES_BEFORE_SOCKET_RESET = 2  # Failed sends retried as-is before the socket is reset
+FAILURES_BEFORE_ESP_RESET = 5  # Consecutive failed sends before the ESP32 itself is reset
+BACKOFF_BASE = 0.5  # Seconds before the first retry
+BACKOFF_MAX = 10  # Longest wait between attempts, so an outage ends at most this long before we notice
+OFFLINE_BUFFER = 64  # Records kept while the server is unreachable (oldest dropped first)
+MAX_BATCH = 32  # Most records sent in one request while draining the buffer
+
+class ServerError(RuntimeError):
+    """The server answered but couldn't take the records now (5xx or 408)"""
+
+class TelemetryClient:
+    """Status sender with session reuse, tiered recovery and an offline buffer
+
+    connect() joins the WiFi network. make_session() returns a requests
+    session; it is called again after a socket reset and should release
+    the previous session's sockets. For UDP pass make_socket(), returning
+    a connected datagram socket, instead. Pass buffer, a StatusBuffer
+    matching binary, to keep pending records in it. reset() resets the
+    ESP32 (esp.reset() by default).
+    """
+
+    def __init__(self, esp, server_url, connect, make_session=None, make_socket=None,
+                 batch_size=1, max_age=40, binary=False, on_esp_reset=None, buffer=None, reset=None, clock=time.monotonic):
+        self.esp = esp
+        self.server_url = server_url
+        self.connect = connect
+        self.make_session = make_session
+        self.make_socket = make_socket
+        self.batch_size = batch_size
+        self.max_age = max_age  # Seconds before a partial batch is sent anyway
+        self.binary = binary or make_socket is not None
+        self.on_esp_reset = on_esp_reset
+        self.reset = reset
+        self.clock = clock
+        self.session = None
+        self.socket = None
+        self.buffer = buffer
+        self.pending = [] if buffer is None else buffer
+        self.urls = (server_url + "/status", server_url + "/status/batch")
+        self.headers = {"Content-Type": STATUS_CONTENT_TYPE if self.binary else "application/json"}
+        self.oldest = 0  # clock() when the oldest pending record was queued
+        self.next_attempt = 0  # clock() before which nothing is sent (backoff or Retry-After)
+        self.failures = 0  # Failed sends since the last success or ESP32 reset
+        self.attempts = 0  # Failed sends since the last success; sets the backoff
+        self.failing_since = None  # clock() of the first failure of the current outage
+        self.sequence = 0  # Next UDP datagram sequence number
+        self.stats = {"sent": 0, "requests": 0, "failures": 0, "socket_resets": 0, "esp_resets": 0,
+                      "dropped": 0, "rejected": 0, "recoveries": 0, "last_recovery": None}
+
+    def queue(self, record):
+        """Buffer a copy of a status record until it is sent"""
+        if not self.pending:
+            self.oldest = self.clock()
+        if len(self.pending) >= OFFLINE_BUFFER:
+            self.pending.pop(0)
+            self.stats["dropped"] += 1
+        self.pending.append(record.copy())
+
+    def queue_status(self, status, count, timestamp):
+        """Encode a status record straight into the StatusBuffer"""
+        if not len(self.buffer):
+            self.oldest = self.clock()
+        if self.buffer.append(status, count, timestamp):
+            self.stats["dropped"] += 1
+
+    def due(self):
+        """Whether poll() would try to send now"""
+        now = self.clock()
+        if not len(self.pending) or now < self.next_attempt:
+            return False
+        return len(self.pending) >= self.batch_size or now - self.oldest >= self.max_age
+
+    def poll(self):
+        """Send whatever is due; returns the records sent (0 while holding off)
+
+        A backlog left by an outage goes out in MAX_BATCH pieces, one
+        after another, as long as each one gets through.
+        """
+        if not self.due():
+            return 0
+        sent = self.stats["sent"]
+        try:
+            while len(self.pending):
+                count = self.send(min(len(self.pending), MAX_BATCH))
+                if not count:
+                    break  # Server asked us to back off
+                if self.buffer is None:
+                    del self.pending[:count]
+                else:
+                    self.buffer.consume(count)
+                if len(self.pending) < self.batch_size:
+                    break
+        except SEND_ERRORS as e:
+            self.failed(e)
+            return self.stats["sent"] - sent
+        self.succeeded()
+        return self.stats["sent"] - sent
+
+    def send(self, count):
+        """Send the first count pending records in one request or datagram
+
+        Returns how many records are done with: sent, or refused by the
+        server for good. Raises ServerError when they should be retried.
+        """
+        if self.make_socket is not None:
+            if self.socket is None:
+                self.ensure_connected()
+                self.socket = self.make_socket()
+            self.socket.send(encode_datagram(self.sequence, self.packed(count)))
+            self.sequence += 1
+        else:
+            if self.session is None:
+                self.ensure_connected()
+                self.session = self.make_session()
+            url = self.urls[count > 1]
+            if self.binary:
+                response = self.session.post(url, data=self.packed(count), headers=self.headers)
+            elif self.buffer is not None:
+                response = self.session.post(url, data=self.buffer.body(count), headers=self.headers)
+            else:
+                response = self.session.post(url, json=self.pending[0] if count == 1 else self.pending[:count])
+            status = response.status_code
+            retry_after = response.headers.get("retry-after", 1) if status == 429 else 0
+            response.close()
+            if status == 429:
+                self.next_attempt = self.clock() + int(retry_after)
+                print(f"⏳ Server busy, holding {len(self.pending)} records for {retry_after}s")
+                return 0
+            if status >= 500 or status == 408:
+                raise ServerError("server answered %d" % status)
+            if status >= 400:
+                self.stats["requests"] += 1
+                self.stats["rejected"] += count
+                print(f"⚠️ Server refused {count} records ({status}), dropping them")
+                return count
+        self.stats["requests"] += 1
+        self.stats["sent"] += count
+        return count
+
+    def packed(self, count):
+        """The first count pending records as back-to-back status_wire records"""
+        if self.buffer is not None:
+            return self.buffer.body(count)
+        return b"".join([encode_status(record["status"], record["count"], record["timestamp"],
+                                       record["ip_address"]) for record in self.pending[:count]])
+
+    def ensure_connected(self):
+        """Rejoin WiFi if the access point dropped us"""
+        if not self.esp.is_connected:
+            print("📶 Rejoining WiFi...")
+            self.connect()
+
+    def succeeded(self):
+        if self.failing_since is not None:
+            recovery = self.clock() - self.failing_since
+            self.stats["recoveries"] += 1
+            self.stats["last_recovery"] = recovery
+            print(f"✅ Server reachable again after {recovery:.1f}s, {len(self.pending)} records still buffered")
+        self.failures = 0
+        self.attempts = 0
+        self.failing_since = None
+
+    def failed(self, error):
+        """Take the next step on the recovery ladder and schedule a retry"""
+        self.attempts += 1
+        self.stats["failures"] += 1
+        if self.failing_since is None:
+            self.failing_since = self.clock()
+        if isinstance(error, ServerError):
+            print(f"⚠️ Send failed ({error}), holding {len(self.pending)} records")
+        else:
+            self.climb(error)
+        # Equal jitter: at least half the exponential delay, so retries from a fleet spread out
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.attempts - 1))
+        self.next_attempt = self.clock() + delay / 2 + random.random() * delay / 2
+
+    def climb(self, error):
+        """Reset whatever the failure points at: socket, WiFi or the ESP32"""
+        self.failures += 1
+        try:
+            connected = self.esp.is_connected
+        except SEND_ERRORS:
+            connected = None  # The ESP32 itself isn't answering
+        if connected is None or self.failures >= FAILURES_BEFORE_ESP_RESET:
+            print(f"⚠️ Send failed {self.failures} times ({error}), resetting ESP32")
+            self.reset_esp()
+        elif not connected:
+            print(f"⚠️ Send failed ({error}), WiFi dropped, rejoining")
+            self.reset_socket()
+            try:
+                self.connect()
+            except SEND_ERRORS as e:
+                print(f"❌ Rejoining WiFi failed: {e}")
+        elif self.failures > RETRIES_BEFORE_SOCKET_RESET:
+            print(f"⚠️ Send failed ({error}), resetting socket")
+            self.reset_socket()
+        else:
+            print(f"⚠️ Send failed ({error}), retrying")
+
+    def reset_socket(self):
+        """Drop the session or UDP socket; the next send opens a new one"""
+        self.stats["socket_resets"] += 1
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except SEND_ERRORS:
+                pass
+        self.socket = None
+        self.session = None
+
+    def reset_esp(self):
+        """Last resort: reset the ESP32 and rejoin WiFi"""
+        self.stats["esp_resets"] += 1
+        self.failures = 0
+        self.socket = None
+        self.session = None
+        if self.on_esp_reset is not None:
+            self.on_esp_reset()
+        try:
+            if self.reset is None:
+                self.esp.reset()
+            else:
+                self.reset()
+            self.connect()
+        except SEND_ERRORS as e:
+            print(f"❌ ESP32 recovery failed: {e}")
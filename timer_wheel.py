@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Hashed timer wheel for simple_server.py's device liveness watchdog
+
+One timer per key (a device id). Rescheduling a key on every report and
+cancelling it are O(1): the key just moves to the slot for its new
+deadline. expire() only visits the slots whose time has come, so a pass
+costs the timers in those slots, not every device being tracked.
+Deadlines more than one revolution away wait in their slot and are
+skipped until a later pass reaches them.
+"""
+
+import time
+
+class TimerWheel:
+    """Deadlines bucketed into slots of tick seconds"""
+
+    def __init__(self, tick=1.0, slots=512, start=None):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # key -> deadline
+        self.slot_of = {}  # key -> index into slots
+        self.next_tick = self._tick_of(time.time() if start is None else start)  # Oldest tick not fully expired
+
+    def _tick_of(self, when):
+        return int(when // self.tick)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def schedule(self, key, deadline):
+        """Set key's deadline (time.time() based), replacing any earlier one"""
+        self.cancel(key)
+        # A deadline already behind the wheel goes in the next slot to expire
+        index = max(self._tick_of(deadline), self.next_tick) % len(self.slots)
+        self.slots[index][key] = deadline
+        self.slot_of[key] = index
+
+    def cancel(self, key):
+        index = self.slot_of.pop(key, None)
+        if index is not None:
+            del self.slots[index][key]
+
+    def expire(self, now):
+        """Remove and return the keys whose deadline is at or before now"""
+        current = self._tick_of(now)
+        expired = []
+        # After a long pause one revolution covers every slot
+        for tick in range(max(self.next_tick, current - len(self.slots) + 1), current + 1):
+            slot = self.slots[tick % len(self.slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self.slot_of[key]
+            expired.extend(due)
+        # The current tick isn't over, so it is visited again next time
+        self.next_tick = current
+        return expired
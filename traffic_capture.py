@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Capture file for status traffic posted to simple_server.py
+
+simple_server.py --record capture.m4cap appends every POST /status,
+/status/batch and /data request as it arrives; bench/replay_capture.py
+plays a capture back. Requests are stored in arrival order with the
+sender's address, so replay can keep each board's posts in order.
+A path ending in .gz is gzip-compressed.
+
+Layout: CAPTURE_MAGIC, then one record per request:
+    arrival     d   server time.time() when the request was read
+    path        B   index into CAPTURE_PATHS
+    binary      B   1 if the body is status_wire records
+    peer length B
+    body length I
+    peer        peer length bytes, the sender's IP address
+    body        body length bytes, exactly as received
+"""
+
+import gzip
+import struct
+
+CAPTURE_MAGIC = b'M4CAP\x01'
+CAPTURE_PATHS = ('/status', '/status/batch', '/data')
+CAPTURE_HEADER = struct.Struct('<dBBBI')
+
+def open_capture(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+class CaptureWriter:
+    """Append requests to a capture file; buffered, so cheap per request"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open_capture(path, 'wb')
+        self.file.write(CAPTURE_MAGIC)
+        self.records = 0
+
+    def write(self, arrival, path, binary, peer, body):
+        peer = peer.encode()[:255]
+        self.file.write(CAPTURE_HEADER.pack(arrival, CAPTURE_PATHS.index(path), binary, len(peer), len(body)))
+        self.file.write(peer)
+        self.file.write(body)
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+def read_capture(path):
+    """Yield (arrival, path, binary, peer, body) for every recorded request"""
+    with open_capture(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a status capture")
+        while True:
+            header = f.read(CAPTURE_HEADER.size)
+            if len(header) < CAPTURE_HEADER.size:
+                return  # End of file, or a record cut short by a crash
+            arrival, path_index, binary, peer_length, body_length = CAPTURE_HEADER.unpack(header)
+            peer = f.read(peer_length).decode()
+            body = f.read(body_length)
+            if len(body) < body_length:
+                return
+            yield arrival, CAPTURE_PATHS[path_index], bool(binary), peer, body
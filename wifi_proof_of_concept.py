@@ -1,7 +1,9 @@
 # Community-Proven WiFi Solution for Metro M4 Airlift Lite
 # Based on web search findings - uses esp.reset() and proper error handling
+# The LED, sends and WiFi recovery run as cooperative tasks (device_tasks.py)
 
 import time
+import asyncio
 import board
 import busio
 import digitalio
@@ -20,6 +22,36 @@ except ImportError as e:
     SERVER_PORT = "8000"
     print("⚠️ Using fallback credentials")
 
+# Optional batching: buffer status records and send them in one request
+try:
+    from config import STATUS_BATCH_SIZE, STATUS_BATCH_MAX_AGE
+except ImportError:
+    STATUS_BATCH_SIZE = 1  # 1 = send every update immediately (no batching)
+    STATUS_BATCH_MAX_AGE = 40  # Seconds before a partial batch is sent anyway
+
+# Optional compact binary records (needs status_wire.py on CIRCUITPY)
+try:
+    from config import USE_BINARY_STATUS
+except ImportError:
+    USE_BINARY_STATUS = False
+
+# Optional fire-and-forget UDP datagrams instead of HTTP (binary records)
+try:
+    from config import USE_UDP_STATUS, SERVER_UDP_PORT
+except ImportError:
+    USE_UDP_STATUS = False
+    SERVER_UDP_PORT = 8766
+
+# Optional blink timing
+try:
+    from config import BLINK_SECONDS
+except ImportError:
+    BLINK_SECONDS = 2  # Seconds ON, then the same OFF
+
+from device_tasks import DeviceLoop
+from status_buffer import StatusBuffer
+from telemetry_client import OFFLINE_BUFFER, TelemetryClient
+
 print("🚀 Community-Proven WiFi Solution Starting...")
 
 # Set up NeoPixel for status indication
@@ -37,7 +69,7 @@ PURPLE = (255, 0, 255)
 def show_status(color, message):
     """Show status on NeoPixel and print message"""
     pixel[0] = color
-    print(f"💡 {message}")
+    print("💡", message)
 
 # ESP32 Setup
 esp32_cs = digitalio.DigitalInOut(board.ESP_CS)
@@ -59,121 +91,58 @@ try:
     show_status(GREEN, "WiFi connected!")
     
     # Get IP address
-    print(f"🌐 My IP address: {esp.pretty_ip(esp.ip_address)}")
+    ip_address = esp.pretty_ip(esp.ip_address)
+    print(f"🌐 My IP address: {ip_address}")
+    
+    # Status records are encoded in place, so the blink loop doesn't leave garbage behind
+    status_buffer = StatusBuffer(OFFLINE_BUFFER, "Metro M4 Airlift Lite", ip_address,
+                                 binary=USE_BINARY_STATUS or USE_UDP_STATUS)
+    
+    def update_ip():
+        status_buffer.set_ip(esp.pretty_ip(esp.ip_address))  # DHCP may hand out a new address after a rejoin
     
     # Setup requests
     import adafruit_esp32spi.adafruit_esp32spi_socketpool as socketpool
     import adafruit_requests
     
     pool = socketpool.SocketPool(esp)
-    requests_session = adafruit_requests.Session(pool)
+    
+    def make_session():
+        """Fresh requests session, closing the sockets the previous one left open"""
+        try:
+            import adafruit_connection_manager
+            adafruit_connection_manager.connection_manager_close_all(release_references=True)
+        except (ImportError, AttributeError):
+            pass  # Older adafruit_requests without the connection manager
+        return adafruit_requests.Session(pool)
+    
+    def make_udp_socket():
+        udp_socket = pool.socket(pool.AF_INET, pool.SOCK_DGRAM)
+        udp_socket.connect((SERVER_IP, SERVER_UDP_PORT))
+        return udp_socket
     
     server_url = f"http://{SERVER_IP}:{SERVER_PORT}"
     print(f"🔗 Server URL: {server_url}")
     
-    print("🚀 Starting continuous NeoPixel blinking with community-proven error recovery...")
+    def show_blink(on, count):
+        show_status(GREEN if on else OFF, "ON" if on else "OFF")
+        print("💡 NeoPixel", "ON" if on else "OFF", "- Count:", count)
     
-    blink_count = 0
+    device = DeviceLoop(esp, WIFI_SSID, WIFI_PASSWORD, show_blink, blink_seconds=BLINK_SECONDS, on_join=update_ip)
     
-    while True:
-        try:
-            # Memory cleanup every 10 cycles
-            if blink_count % 10 == 0:
-                try:
-                    import gc
-                    gc.collect()
-                    print(f"🧹 Memory cleanup - Count: {blink_count}")
-                except:
-                    pass
-            
-            # Turn NeoPixel ON
-            show_status(GREEN, "ON")
-            print(f"💡 NeoPixel ON - Count: {blink_count}")
-            
-            # Send ON status to server
-            status_data = {
-                "status": "ON",
-                "count": blink_count,
-                "board": "Metro M4 Airlift Lite",
-                "ip_address": esp.pretty_ip(esp.ip_address),
-                "timestamp": time.time()
-            }
-            
-            try:
-                response = requests_session.post(f"{server_url}/status", json=status_data)
-                response.close()
-                print("✅ ON status sent successfully")
-            except (ValueError, RuntimeError, ConnectionError, OSError) as e:
-                print(f"⚠️ ESP has an issue, resetting and retrying: {e}")
-                show_status(PURPLE, "Resetting ESP32...")
-                
-                # Community-proven reset sequence
-                esp.reset()
-                esp.disconnect()
-                time.sleep(5)  # Wait for ESP32 to boot
-                esp.connect_AP(WIFI_SSID, WIFI_PASSWORD)
-                show_status(GREEN, "ESP32 reset complete!")
-                
-                # Retry the request after successful reset
-                try:
-                    response = requests_session.post(f"{server_url}/status", json=status_data)
-                    response.close()
-                    print("✅ ON status sent after reset")
-                except Exception as retry_e:
-                    print(f"❌ Still failed after reset: {retry_e}")
-            
-            time.sleep(2)  # Stay ON for 2 seconds
-            
-            # Turn NeoPixel OFF
-            show_status(OFF, "OFF")
-            print(f"💡 NeoPixel OFF - Count: {blink_count}")
-            
-            # Send OFF status to server
-            status_data["status"] = "OFF"
-            try:
-                response = requests_session.post(f"{server_url}/status", json=status_data)
-                response.close()
-                print("✅ OFF status sent successfully")
-            except (ValueError, RuntimeError, ConnectionError, OSError) as e:
-                print(f"⚠️ ESP has an issue, resetting and retrying: {e}")
-                show_status(PURPLE, "Resetting ESP32...")
-                
-                # Community-proven reset sequence
-                esp.reset()
-                esp.disconnect()
-                time.sleep(5)  # Wait for ESP32 to boot
-                esp.connect_AP(WIFI_SSID, WIFI_PASSWORD)
-                show_status(GREEN, "ESP32 reset complete!")
-                
-                # Retry the request after successful reset
-                try:
-                    response = requests_session.post(f"{server_url}/status", json=status_data)
-                    response.close()
-                    print("✅ OFF status sent after reset")
-                except Exception as retry_e:
-                    print(f"❌ Still failed after reset: {retry_e}")
-            
-            time.sleep(2)  # Stay OFF for 2 seconds
-            
-            blink_count += 1
-            
-        except Exception as e:
-            print(f"❌ Error in blink loop: {e}")
-            show_status(RED, f"Error: {type(e).__name__}")
-            
-            # Try to reset and reconnect on any major error
-            try:
-                print("🔄 Attempting ESP32 reset and recovery...")
-                show_status(PURPLE, "Resetting ESP32...")
-                esp.reset()
-                esp.disconnect()
-                time.sleep(5)
-                esp.connect_AP(WIFI_SSID, WIFI_PASSWORD)
-                show_status(GREEN, "Recovery successful!")
-                print("✅ Recovery successful, continuing...")
-            except Exception as recovery_e:
-                print(f"❌ Recovery failed: {recovery_e}")
-                time.sleep(10)
+    # Retries happen inside the client; rejoining and ESP32 resets are left to the device loop's supervisor
+    device.client = TelemetryClient(esp, server_url, device.request_join, reset=device.request_reset,
+                                    make_session=make_session,
+                                    make_socket=make_udp_socket if USE_UDP_STATUS else None,
+                                    batch_size=STATUS_BATCH_SIZE, max_age=STATUS_BATCH_MAX_AGE,
+                                    binary=USE_BINARY_STATUS,
+                                    on_esp_reset=lambda: show_status(PURPLE, "Resetting ESP32..."),
+                                    buffer=status_buffer)
+    
+    print("🚀 Starting continuous NeoPixel blinking with community-proven error recovery...")
+    
+    # Runs forever: the LED keeps its timing while sends and recovery happen in between
+    asyncio.run(device.run())
     
 except Exception as e:
     print(f"❌ Error: {e}")